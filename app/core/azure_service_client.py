@@ -1,26 +1,142 @@
-from openai import AzureOpenAI
+import asyncio
+from functools import lru_cache
+import numpy as np
 from app.core.config.config import Config
+from app.core.embedding_cache import get_embedding_cache
+from app.core.metrics import count, timed
+from app.core.scheduler import get_scheduler
+from app.utils.vectors import to_matrix
  
 class AzureOpenAIClient:
+    """
+    Async Azure OpenAI client shared by every service in the process.
+
+    Requests go through one pooled HTTP connection pool, and at most
+    AZURE_OPENAI_MAX_IN_FLIGHT requests are outstanding at any time. Each
+    deployment's calls are admitted and retried by its RequestScheduler, so
+    the SDK's own retries are turned off.
+    """
     def __init__(self):
-        self.client = AzureOpenAI(
+        # The SDK and tokenizer load with the first client rather than at app import
+        import httpx
+        import tiktoken
+        from openai import AsyncAzureOpenAI, DefaultAsyncHttpxClient
+
+        self.client = AsyncAzureOpenAI(
             api_key=Config.AZURE_OPENAI_API_KEY,
             api_version=Config.AZURE_OPENAI_API_VERSION,
-            azure_endpoint=Config.AZURE_OPENAI_ENDPOINT
+            azure_endpoint=Config.AZURE_OPENAI_ENDPOINT,
+            max_retries=0,
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=Config.AZURE_OPENAI_MAX_IN_FLIGHT,
+                    max_keepalive_connections=Config.AZURE_OPENAI_MAX_IN_FLIGHT
+                )
+            )
         )
+        self.encoding = tiktoken.get_encoding("cl100k_base")
+        self._in_flight = asyncio.Semaphore(Config.AZURE_OPENAI_MAX_IN_FLIGHT)
+        self.embedding_cache = get_embedding_cache()
+        self.chat_scheduler = get_scheduler("chat")
+        self.embedding_scheduler = get_scheduler("embeddings")
  
-    def generate_embedding(self, text: str):
-        response = self.client.embeddings.create(
-            input=[text],
-            model=Config.AZURE_OPENAI_EMBEDDING_MODEL_NAME
-        )
-        return response.data[0].embedding
+    async def generate_embedding(self, text: str) -> np.ndarray:
+        return (await self.generate_embeddings([text]))[0]
+
+    async def generate_embeddings(self, texts: list[str]) -> np.ndarray:
+        """
+        Embeds many texts using as few requests as possible.
+
+        Texts found in the embedding cache, and repeats within `texts`, are
+        not sent to the service.
+
+        Args:
+            texts: Texts to embed.
+
+        Returns:
+            float32 matrix with one embedding row per text, in the same order as `texts`.
+        """
+        model = Config.AZURE_OPENAI_EMBEDDING_MODEL_NAME
+        if self.embedding_cache is not None:
+            # The cache may have a SQLite tier, so keep its I/O off the event loop
+            embeddings = await asyncio.to_thread(self.embedding_cache.get_many, model, texts)
+        else:
+            embeddings = [None] * len(texts)
+
+        missing = list(dict.fromkeys(text for text, embedding in zip(texts, embeddings) if embedding is None))
+        if missing:
+            with timed("embed"):
+                batches = await asyncio.gather(
+                    *(self._embed_batch(batch, tokens) for batch, tokens in self._pack_embedding_batches(missing))
+                )
+            fetched = np.concatenate(batches)
+            if self.embedding_cache is not None:
+                await asyncio.to_thread(self.embedding_cache.set_many, model, missing, fetched)
+            fetched_by_text = dict(zip(missing, fetched))
+            embeddings = [
+                embedding if embedding is not None else fetched_by_text[text]
+                for text, embedding in zip(texts, embeddings)
+            ]
+        return to_matrix(np.stack(embeddings)) if embeddings else to_matrix([])
+
+    async def _embed_batch(self, batch: list[str], tokens: int) -> np.ndarray:
+        async def call():
+            async with self._in_flight:
+                return await self.client.embeddings.create(
+                    input=batch,
+                    model=Config.AZURE_OPENAI_EMBEDDING_MODEL_NAME
+                )
+
+        response = await self.embedding_scheduler.submit(call, tokens=tokens)
+        if response.usage:
+            count("azure_tokens", response.usage.prompt_tokens, service="embeddings", kind="prompt")
+        # The service does not guarantee response order, so sort by input index
+        return to_matrix([item.embedding for item in sorted(response.data, key=lambda d: d.index)])
+
+    def _pack_embedding_batches(self, texts: list[str]):
+        """
+        Splits texts into batches that respect the per-request item and token limits,
+        yielding each batch with its token count.
+        """
+        batch, batch_tokens = [], 0
+        for text in texts:
+            tokens = len(self.encoding.encode(text))
+            if batch and (
+                len(batch) >= Config.EMBEDDING_BATCH_SIZE
+                or batch_tokens + tokens > Config.EMBEDDING_BATCH_MAX_TOKENS
+            ):
+                yield batch, batch_tokens
+                batch, batch_tokens = [], 0
+            batch.append(text)
+            batch_tokens += tokens
+        if batch:
+            yield batch, batch_tokens
  
-    def generate_completion(self, prompt: str, max_tokens: int = 300):
-        response = self.client.chat.completions.create(
-            model=Config.AZURE_OPENAI_DEPLOYMENT_NAME,
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=max_tokens,
-            temperature=0.1
-        )
+    async def generate_completion(self, prompt: str, max_tokens: int = 300, response_format: dict = None):
+        extra_args = {"response_format": response_format} if response_format else {}
+
+        async def call():
+            async with self._in_flight:
+                return await self.client.chat.completions.create(
+                    model=Config.AZURE_OPENAI_DEPLOYMENT_NAME,
+                    messages=[{"role": "user", "content": prompt}],
+                    max_tokens=max_tokens,
+                    temperature=0.1,
+                    **extra_args
+                )
+
+        # The TPM quota counts max_tokens up front, so budget for prompt plus completion
+        tokens = len(self.encoding.encode(prompt)) + max_tokens
+        response = await self.chat_scheduler.submit(call, tokens=tokens)
+        if response.usage:
+            count("azure_tokens", response.usage.prompt_tokens, service="chat", kind="prompt")
+            count("azure_tokens", response.usage.completion_tokens, service="chat", kind="completion")
         return response.choices[0].message.content
+
+
+@lru_cache(maxsize=None)
+def get_azure_openai_client() -> AzureOpenAIClient:
+    """
+    Returns the process-wide AzureOpenAIClient, creating it on first use.
+    """
+    return AzureOpenAIClient()
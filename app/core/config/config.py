@@ -17,5 +17,114 @@ class Config:
     FORM_RECOGNIZER_ENDPOINT = os.getenv("FORM_RECOGNIZER_ENDPOINT")
     FORM_RECOGNIZER_API_KEY = os.getenv("FORM_RECOGNIZER_API_KEY")
 
-    if not FORM_RECOGNIZER_ENDPOINT or not FORM_RECOGNIZER_API_KEY:
-        raise ValueError("FORM_RECOGNIZER_ENDPOINT and FORM_RECOGNIZER_API_KEY must be set in the environment.")
\ No newline at end of file
+    # Embedding request packing (per-request item and token limits)
+    EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))
+    EMBEDDING_BATCH_MAX_TOKENS = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "100000"))
+
+    # Rows parsed, embedded and checked at a time when streaming expense files
+    EXPENSE_CHUNK_SIZE = int(os.getenv("EXPENSE_CHUNK_SIZE", "5000"))
+
+    # Maximum concurrent Azure OpenAI requests per worker process
+    AZURE_OPENAI_MAX_IN_FLIGHT = int(os.getenv("AZURE_OPENAI_MAX_IN_FLIGHT", "8"))
+
+    # Per-minute quotas the request scheduler keeps each service within (0 = unlimited),
+    # and its retry policy for throttled (429) and transient (5xx, connection) failures
+    AZURE_OPENAI_CHAT_RPM = float(os.getenv("AZURE_OPENAI_CHAT_RPM", "0"))
+    AZURE_OPENAI_CHAT_TPM = float(os.getenv("AZURE_OPENAI_CHAT_TPM", "0"))
+    AZURE_OPENAI_EMBEDDING_RPM = float(os.getenv("AZURE_OPENAI_EMBEDDING_RPM", "0"))
+    AZURE_OPENAI_EMBEDDING_TPM = float(os.getenv("AZURE_OPENAI_EMBEDDING_TPM", "0"))
+    FORM_RECOGNIZER_RPM = float(os.getenv("FORM_RECOGNIZER_RPM", "0"))
+    SCHEDULER_MAX_RETRIES = int(os.getenv("SCHEDULER_MAX_RETRIES", "6"))
+    SCHEDULER_BACKOFF_BASE_SECONDS = float(os.getenv("SCHEDULER_BACKOFF_BASE_SECONDS", "0.5"))
+    SCHEDULER_BACKOFF_MAX_SECONDS = float(os.getenv("SCHEDULER_BACKOFF_MAX_SECONDS", "30"))
+    SCHEDULER_BURST_SECONDS = float(os.getenv("SCHEDULER_BURST_SECONDS", "10"))
+
+    # Maximum per-record LLM compliance checks in flight per request
+    COMPLIANCE_MAX_CONCURRENCY = int(os.getenv("COMPLIANCE_MAX_CONCURRENCY", "8"))
+
+    # "single" sends one completion per record, "batch" packs several records into one prompt
+    COMPLIANCE_JUDGE_MODE = os.getenv("COMPLIANCE_JUDGE_MODE", "single")
+    JUDGE_BATCH_MAX_RECORDS = int(os.getenv("JUDGE_BATCH_MAX_RECORDS", "20"))
+    JUDGE_BATCH_MAX_PROMPT_TOKENS = int(os.getenv("JUDGE_BATCH_MAX_PROMPT_TOKENS", "6000"))
+    JUDGE_BATCH_COMPLETION_TOKENS_PER_RECORD = int(os.getenv("JUDGE_BATCH_COMPLETION_TOKENS_PER_RECORD", "120"))
+
+    # Maximum policy chunks retrieved into each compliance prompt
+    POLICY_TOP_K = int(os.getenv("POLICY_TOP_K", "5"))
+
+    # Decide clear-cut records from caps extracted out of the policy and send only the
+    # rest to the LLM; amounts within RULE_AMBIGUITY_MARGIN of a cap stay with the LLM
+    POLICY_RULES_ENABLED = os.getenv("POLICY_RULES_ENABLED", "true").lower() == "true"
+    RULE_AMBIGUITY_MARGIN = float(os.getenv("RULE_AMBIGUITY_MARGIN", "0.1"))
+    # Comma-separated categories approved without an LLM call when the policy never mentions them;
+    # any other category without a matching cap is left to the LLM
+    POLICY_UNCAPPED_CATEGORIES = [c.strip() for c in os.getenv("POLICY_UNCAPPED_CATEGORIES", "").split(",") if c.strip()]
+
+    # Maximum receipt analyses in flight against Form Recognizer per request
+    OCR_MAX_IN_FLIGHT = int(os.getenv("OCR_MAX_IN_FLIGHT", "8"))
+
+    # Receipt OCR engine: "azure" (Form Recognizer) or "local" (PyMuPDF + Tesseract process pool)
+    RECEIPT_OCR_ENGINE = os.getenv("RECEIPT_OCR_ENGINE", "azure")
+    LOCAL_OCR_WORKERS = int(os.getenv("LOCAL_OCR_WORKERS", "0")) or os.cpu_count()
+
+    # ZIP/TAR receipt archives are read one member at a time; these limits guard against archive bombs
+    RECEIPT_ARCHIVE_MAX_FILES = int(os.getenv("RECEIPT_ARCHIVE_MAX_FILES", "10000"))
+    RECEIPT_ARCHIVE_MAX_FILE_MB = float(os.getenv("RECEIPT_ARCHIVE_MAX_FILE_MB", "50"))
+    RECEIPT_ARCHIVE_MAX_TOTAL_MB = float(os.getenv("RECEIPT_ARCHIVE_MAX_TOTAL_MB", "4096"))
+
+    # Local storage for ingested artifacts (stored policies, caches)
+    STORAGE_DIR = os.getenv("STORAGE_DIR", str(Path(__file__).resolve().parents[3] / "storage"))
+    POLICY_STORE_DIR = os.getenv("POLICY_STORE_DIR", os.path.join(STORAGE_DIR, "policies"))
+    VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR", os.path.join(STORAGE_DIR, "vectors"))
+    # Stored vectors expire this long after they were last saved; expired files are swept at most once per interval
+    VECTOR_STORE_TTL_SECONDS = float(os.getenv("VECTOR_STORE_TTL_SECONDS", str(7 * 24 * 3600)))
+    VECTOR_STORE_PURGE_INTERVAL_SECONDS = float(os.getenv("VECTOR_STORE_PURGE_INTERVAL_SECONDS", "3600"))
+
+    # Background compliance jobs: SQLite queue plus per-process asyncio workers
+    JOBS_DIR = os.getenv("JOBS_DIR", os.path.join(STORAGE_DIR, "jobs"))
+    JOB_DB_PATH = os.getenv("JOB_DB_PATH", os.path.join(STORAGE_DIR, "jobs.sqlite3"))
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))
+    JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+    JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "10"))
+    # Progress updates are written to the job store at most once per interval
+    JOB_PROGRESS_INTERVAL_SECONDS = float(os.getenv("JOB_PROGRESS_INTERVAL_SECONDS", "1"))
+    JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "60"))
+    # Finished jobs, with their reports, are deleted this long after they end (0 keeps them); workers check every interval
+    JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", str(7 * 24 * 3600)))
+    JOB_PURGE_INTERVAL_SECONDS = float(os.getenv("JOB_PURGE_INTERVAL_SECONDS", "3600"))
+
+    # Embedding cache: in-process LRU plus an optional SQLite tier shared by all workers
+    EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+    EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "50000"))
+    EMBEDDING_CACHE_DISK_ENABLED = os.getenv("EMBEDDING_CACHE_DISK_ENABLED", "false").lower() == "true"
+    EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(STORAGE_DIR, "embedding_cache.sqlite3"))
+    EMBEDDING_CACHE_DISK_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_DISK_MAX_ENTRIES", "1000000"))
+
+    # Persistent cache of LLM compliance verdicts, keyed by the normalized record, policy chunks, model and prompt
+    VERDICT_CACHE_ENABLED = os.getenv("VERDICT_CACHE_ENABLED", "true").lower() == "true"
+    VERDICT_CACHE_PATH = os.getenv("VERDICT_CACHE_PATH", os.path.join(STORAGE_DIR, "verdict_cache.sqlite3"))
+    VERDICT_CACHE_MAX_ENTRIES = int(os.getenv("VERDICT_CACHE_MAX_ENTRIES", "200000"))
+    VERDICT_CACHE_TTL_SECONDS = float(os.getenv("VERDICT_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+
+    # Persistent cache of OCR fields and chunk embeddings per receipt file, keyed by content hash and OCR engine.
+    # The perceptual (dHash) option also flags near-identical photos in a batch as duplicates. Receipts printed
+    # from one template can share a dHash, so those matches never reuse another receipt's OCR fields.
+    RECEIPT_CACHE_ENABLED = os.getenv("RECEIPT_CACHE_ENABLED", "true").lower() == "true"
+    RECEIPT_CACHE_PATH = os.getenv("RECEIPT_CACHE_PATH", os.path.join(STORAGE_DIR, "receipt_cache.sqlite3"))
+    RECEIPT_CACHE_MAX_ENTRIES = int(os.getenv("RECEIPT_CACHE_MAX_ENTRIES", "100000"))
+    RECEIPT_CACHE_TTL_SECONDS = float(os.getenv("RECEIPT_CACHE_TTL_SECONDS", str(90 * 24 * 3600)))
+    RECEIPT_PERCEPTUAL_HASH = os.getenv("RECEIPT_PERCEPTUAL_HASH", "false").lower() == "true"
+    RECEIPT_PERCEPTUAL_MAX_DISTANCE = int(os.getenv("RECEIPT_PERCEPTUAL_MAX_DISTANCE", "4"))
+
+    # Load heavy libraries and service clients in the background once the app has started
+    PRELOAD_ON_STARTUP = os.getenv("PRELOAD_ON_STARTUP", "true").lower() == "true"
+
+    @classmethod
+    def require(cls, *names: str):
+        """
+        Raises if any of the named settings is unset. Services call this when
+        they first build their client, so a missing setting only breaks the
+        feature that needs it instead of the whole app at import.
+        """
+        missing = [name for name in names if not getattr(cls, name)]
+        if missing:
+            raise ValueError(f"{' and '.join(missing)} must be set in the environment.")
\ No newline at end of file
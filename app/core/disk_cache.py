@@ -0,0 +1,115 @@
+import os
+import sqlite3
+import threading
+import time
+
+
+class DiskCache:
+    """
+    SQLite-backed key/value cache that several worker processes can share.
+
+    Entries are evicted least-recently-used once `max_entries` is exceeded,
+    and expire after `ttl_seconds` when a TTL is given. Expired entries are
+    never returned; eviction itself runs every `evict_every` written entries
+    or `evict_interval` seconds rather than on every write, so the cache may
+    briefly hold up to `evict_every` entries more than `max_entries`.
+
+    All methods block on SQLite, so async callers run them with asyncio.to_thread.
+    """
+    def __init__(
+        self,
+        path: str,
+        max_entries: int,
+        ttl_seconds: float = None,
+        evict_every: int = 1000,
+        evict_interval: float = 60
+    ):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.evict_every = evict_every
+        self.evict_interval = evict_interval
+        self._writes_since_evict = 0
+        self._last_evict = time.monotonic()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY,"
+            " value BLOB NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_created_at ON cache (created_at)")
+
+    def get(self, key: str):
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: list[str]) -> dict:
+        """
+        Returns the cached values for whichever of `keys` are present.
+        """
+        found = {}
+        if not keys:
+            return found
+        now = time.time()
+        with self._lock:
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                query = f"SELECT key, value, created_at FROM cache WHERE key IN ({placeholders})"
+                for key, value, created_at in self._conn.execute(query, batch):
+                    if self.ttl_seconds is None or now - created_at <= self.ttl_seconds:
+                        found[key] = value
+            if found:
+                self._conn.executemany(
+                    "UPDATE cache SET accessed_at = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+        return found
+
+    def set(self, key: str, value: bytes):
+        self.set_many({key: value})
+
+    def set_many(self, items: dict):
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    [(key, value, now, now) for key, value in items.items()]
+                )
+                self._writes_since_evict += len(items)
+                if self._writes_since_evict >= self.evict_every or time.monotonic() - self._last_evict >= self.evict_interval:
+                    self._evict(now)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def delete_many(self, keys: list[str]):
+        with self._lock:
+            self._conn.executemany("DELETE FROM cache WHERE key = ?", [(key,) for key in keys])
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def _evict(self, now: float):
+        self._writes_since_evict = 0
+        self._last_evict = time.monotonic()
+        if self.ttl_seconds is not None:
+            self._conn.execute("DELETE FROM cache WHERE created_at < ?", (now - self.ttl_seconds,))
+        excess = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0] - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed_at LIMIT ?)",
+                (excess,)
+            )
@@ -0,0 +1,64 @@
+import asyncio
+import numpy as np
+from app.core.config.config import Config
+from app.utils.vectors import to_matrix
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces embedding requests from concurrent coroutines into shared
+    generate_embeddings calls.
+
+    Texts submitted within `max_delay` seconds of each other are embedded
+    together, and a batch is sent early once it reaches `max_batch_size` texts.
+    """
+    def __init__(self, client, max_batch_size: int = None, max_delay: float = 0.05):
+        self.client = client
+        self.max_batch_size = max_batch_size or Config.EMBEDDING_BATCH_SIZE
+        self.max_delay = max_delay
+        self._pending = []  # (texts, future) pairs waiting for the next flush
+        self._pending_count = 0
+        self._timer = None
+        self._tasks = set()
+
+    async def embed(self, texts: list[str]) -> np.ndarray:
+        """
+        Returns the embeddings of `texts` as a float32 matrix, in order.
+        """
+        if not texts:
+            return to_matrix([])
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((texts, future))
+        self._pending_count += len(texts)
+        if self._pending_count >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending, self._pending_count = self._pending, [], 0
+        if pending:
+            task = asyncio.ensure_future(self._embed(pending))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _embed(self, pending: list):
+        try:
+            embeddings = await self.client.generate_embeddings(
+                [text for texts, _ in pending for text in texts]
+            )
+        except Exception as e:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        offset = 0
+        for texts, future in pending:
+            if not future.done():
+                future.set_result(embeddings[offset:offset + len(texts)])
+            offset += len(texts)
@@ -0,0 +1,109 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+import numpy as np
+from app.core.config.config import Config
+from app.core.disk_cache import DiskCache
+from app.core.metrics import count
+
+
+def embedding_cache_key(model: str, text: str) -> str:
+    """
+    Returns the content-addressed cache key for embedding `text` with `model`.
+    """
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache: an in-process LRU backed by an optional
+    on-disk tier shared by every worker process.
+    """
+    def __init__(self, max_entries: int, disk_cache: DiskCache = None):
+        self.max_entries = max_entries
+        self.disk_cache = disk_cache
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+    def get_many(self, model: str, texts: list[str]) -> list:
+        """
+        Looks up the embeddings of `texts`.
+
+        Returns:
+            List with the cached float32 embedding row, or None, for each text.
+        """
+        keys = [embedding_cache_key(model, text) for text in texts]
+        results = [None] * len(keys)
+        missing = {}
+        with self._lock:
+            for i, key in enumerate(keys):
+                embedding = self._entries.get(key)
+                if embedding is not None:
+                    self._entries.move_to_end(key)
+                    results[i] = embedding
+                else:
+                    missing.setdefault(key, []).append(i)
+
+        if missing and self.disk_cache is not None:
+            found = self.disk_cache.get_many(list(missing))
+            for key, value in found.items():
+                embedding = np.frombuffer(value, dtype=np.float32)
+                self._remember(key, embedding)
+                for i in missing.pop(key):
+                    results[i] = embedding
+                self.disk_hits += 1
+
+        missed = sum(len(indices) for indices in missing.values())
+        self.hits += len(keys) - missed
+        self.misses += missed
+        count("cache_lookups", len(keys) - missed, cache="embedding", result="hit")
+        count("cache_lookups", missed, cache="embedding", result="miss")
+        return results
+
+    def set_many(self, model: str, texts: list[str], embeddings: list):
+        keys = [embedding_cache_key(model, text) for text in texts]
+        for key, embedding in zip(keys, embeddings):
+            # Copy each row so a cached vector does not keep its whole batch matrix alive
+            self._remember(key, np.array(embedding, dtype=np.float32))
+        if self.disk_cache is not None:
+            self.disk_cache.set_many({
+                key: np.asarray(embedding, dtype=np.float32).tobytes()
+                for key, embedding in zip(keys, embeddings)
+            })
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "memory_entries": len(self._entries),
+            "disk_enabled": self.disk_cache is not None
+        }
+
+    def _remember(self, key: str, embedding):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+@lru_cache(maxsize=None)
+def get_embedding_cache() -> EmbeddingCache:
+    """
+    Returns the process-wide embedding cache, or None when caching is disabled.
+    """
+    if not Config.EMBEDDING_CACHE_ENABLED:
+        return None
+    disk_cache = None
+    if Config.EMBEDDING_CACHE_DISK_ENABLED:
+        disk_cache = DiskCache(Config.EMBEDDING_CACHE_PATH, Config.EMBEDDING_CACHE_DISK_MAX_ENTRIES)
+    return EmbeddingCache(Config.EMBEDDING_CACHE_SIZE, disk_cache)
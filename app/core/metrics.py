@@ -0,0 +1,182 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Process-wide metrics in Prometheus text format, plus a per-request breakdown.
+# Each worker process keeps its own registry, so scrape every worker (or sum them).
+
+METRIC_PREFIX = "expense_auditor"
+
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, math.inf)
+
+COUNTER_HELP = {
+    "azure_calls": "Azure service calls, including retried attempts.",
+    "azure_retries": "Azure service calls retried after a throttling or transient error.",
+    "azure_throttled": "Azure service calls rejected with 429.",
+    "azure_tokens": "Tokens reported by Azure OpenAI usage, by kind.",
+    "cache_lookups": "Embedding, verdict and receipt cache lookups, by result.",
+    "rule_decisions": "Records decided by policy rules without an LLM call."
+}
+
+
+class RequestMetrics:
+    """
+    Stage timings and counters of one request or background job.
+
+    Stage seconds are cumulative: stages running concurrently (e.g. OCR of
+    several receipts) each add their own duration.
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def add_stage(self, stage: str, seconds: float):
+        with self._lock:
+            total = self.stages.setdefault(stage, {"seconds": 0.0, "count": 0})
+            total["seconds"] += seconds
+            total["count"] += 1
+
+    def add_count(self, key: str, value: float):
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                "total_seconds": round(time.perf_counter() - self.started, 4),
+                "stages": {stage: {"seconds": round(t["seconds"], 4), "count": t["count"]} for stage, t in self.stages.items()},
+                "counters": dict(self.counters)
+            }
+
+    def server_timing(self) -> str:
+        """
+        Returns the stage timings as a Server-Timing header value (milliseconds).
+        """
+        with self._lock:
+            return ", ".join(f"{stage};dur={t['seconds'] * 1000:.1f}" for stage, t in self.stages.items())
+
+
+_request_metrics: ContextVar = ContextVar("request_metrics", default=None)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._stage_buckets = {}
+        self._stage_sums = {}
+        self._stage_counts = {}
+
+    def count(self, name: str, value: float, labels: tuple):
+        with self._lock:
+            key = (name, labels)
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe_stage(self, stage: str, seconds: float):
+        with self._lock:
+            buckets = self._stage_buckets.setdefault(stage, [0] * len(STAGE_BUCKETS))
+            for i, bound in enumerate(STAGE_BUCKETS):
+                if seconds <= bound:
+                    buckets[i] += 1
+            self._stage_sums[stage] = self._stage_sums.get(stage, 0.0) + seconds
+            self._stage_counts[stage] = self._stage_counts.get(stage, 0) + 1
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            name = f"{METRIC_PREFIX}_stage_duration_seconds"
+            lines.append(f"# HELP {name} Duration of pipeline stages: parse, ocr, embed, retrieve, judge.")
+            lines.append(f"# TYPE {name} histogram")
+            for stage, buckets in sorted(self._stage_buckets.items()):
+                for bound, value in zip(STAGE_BUCKETS, buckets):
+                    le = "+Inf" if bound == math.inf else repr(float(bound))
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{le}"}} {value}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {self._stage_sums[stage]}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {self._stage_counts[stage]}')
+
+            by_name = {}
+            for (counter, labels), value in self._counters.items():
+                by_name.setdefault(counter, []).append((labels, value))
+            for counter, samples in sorted(by_name.items()):
+                name = f"{METRIC_PREFIX}_{counter}_total"
+                lines.append(f"# HELP {name} {COUNTER_HELP.get(counter, counter)}")
+                lines.append(f"# TYPE {name} counter")
+                for labels, value in sorted(samples):
+                    label_text = ",".join(f'{label}="{label_value}"' for label, label_value in labels)
+                    lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def count(name: str, value: float = 1, **labels):
+    """
+    Adds to a counter, both process-wide and for the current request.
+    """
+    if not value:
+        return
+    label_values = [str(label_value) for label_value in labels.values()]
+    registry.count(name, value, tuple(sorted(zip(labels, label_values))))
+    request_metrics = _request_metrics.get()
+    if request_metrics is not None:
+        # e.g. "azure_tokens.chat.prompt", label values in the order given
+        request_metrics.add_count(".".join([name, *label_values]), value)
+
+
+def observe_stage(stage: str, seconds: float):
+    registry.observe_stage(stage, seconds)
+    request_metrics = _request_metrics.get()
+    if request_metrics is not None:
+        request_metrics.add_stage(stage, seconds)
+
+
+@contextmanager
+def timed(stage: str):
+    """
+    Times the enclosed block as one run of `stage`. Works around awaits too,
+    since it only reads the clock on entry and exit.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+@contextmanager
+def track_request():
+    """
+    Collects the stage timings and counters of everything run inside the
+    block, including tasks it spawns, into a new RequestMetrics.
+    """
+    request_metrics = RequestMetrics()
+    token = _request_metrics.set(request_metrics)
+    try:
+        yield request_metrics
+    finally:
+        _request_metrics.reset(token)
+
+
+def current_request_metrics() -> RequestMetrics:
+    """
+    Returns the RequestMetrics of the current request, or None outside one.
+    """
+    return _request_metrics.get()
+
+
+def request_summary() -> dict:
+    """
+    Returns the timing breakdown and counters of the current request, or None
+    outside one.
+    """
+    request_metrics = _request_metrics.get()
+    return request_metrics.summary() if request_metrics is not None else None
+
+
+def render_prometheus() -> str:
+    return registry.render()
@@ -0,0 +1,43 @@
+import importlib
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Heavy modules the request paths import lazily, loaded ahead of the first request
+PRELOAD_MODULES = [
+    "pandas",
+    "sklearn.metrics.pairwise",
+    "langchain.text_splitter",
+    "fitz",
+    "docx",
+    "openai",
+    "tiktoken",
+    "azure.ai.formrecognizer"
+]
+
+
+def preload_dependencies() -> dict:
+    """
+    Imports the lazily loaded libraries and builds the service clients, so the
+    first request does not pay for them. Failures are reported, not raised:
+    a client with missing settings still fails on first use with its own error.
+
+    Returns:
+        Seconds spent on each module or client, or the error it raised.
+    """
+    from app.core.azure_service_client import get_azure_openai_client
+    from app.services.receipt_service import get_form_recognizer_client
+
+    timings = {}
+    steps = [(name, lambda name=name: importlib.import_module(name)) for name in PRELOAD_MODULES]
+    steps += [("azure_openai_client", get_azure_openai_client), ("form_recognizer_client", get_form_recognizer_client)]
+    for name, step in steps:
+        start = time.perf_counter()
+        try:
+            step()
+            timings[name] = round(time.perf_counter() - start, 3)
+        except Exception as e:
+            timings[name] = f"Error: {str(e)}"
+    logger.info("Preloaded dependencies: %s", timings)
+    return timings
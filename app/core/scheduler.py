@@ -0,0 +1,255 @@
+import asyncio
+import contextvars
+import email.utils
+import heapq
+import itertools
+import logging
+import random
+import time
+from functools import lru_cache
+from typing import Awaitable, Callable
+from app.core.config.config import Config
+from app.core.metrics import count
+
+logger = logging.getLogger(__name__)
+
+# Lower values are admitted first when a budget is exhausted
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+# Default priority for work submitted from the current task, e.g. PRIORITY_LOW for background jobs
+request_priority = contextvars.ContextVar("request_priority", default=PRIORITY_NORMAL)
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Per-minute budget that refills continuously, holding at most
+    `burst_seconds` worth of it. A rate of 0 means unlimited.
+    """
+    def __init__(self, per_minute: float, burst_seconds: float = 60):
+        self.rate = float(per_minute) / 60
+        self.capacity = self.rate * burst_seconds
+        self.available = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.available = min(self.capacity, self.available + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay_for(self, amount: float, now: float) -> float:
+        """
+        Seconds until `amount` can be taken. Requests larger than the whole
+        budget wait for a full bucket rather than forever.
+        """
+        if self.capacity <= 0:
+            return 0.0
+        self._refill(now)
+        needed = min(amount, self.capacity) - self.available
+        return max(0.0, needed / self.rate)
+
+    def consume(self, amount: float, now: float):
+        if self.capacity > 0:
+            self._refill(now)
+            self.available -= min(amount, self.capacity)
+
+
+def _retry_after_seconds(headers) -> float:
+    """
+    Reads the server's requested delay from Retry-After style headers, if any.
+    """
+    if not headers:
+        return None
+    for name in ("retry-after-ms", "x-ms-retry-after-ms"):
+        value = headers.get(name)
+        if value:
+            try:
+                return float(value) / 1000
+            except ValueError:
+                pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        # Malformed header: fall back to the jittered backoff instead of failing the retry
+        return None
+    return max(0.0, retry_at.timestamp() - time.time()) if retry_at else None
+
+
+def classify_error(exc: Exception) -> tuple:
+    """
+    Decides whether a failed call is worth retrying.
+
+    Returns:
+        (retryable, retry_after) where retry_after is the delay the service
+        asked for in seconds, or None.
+    """
+    # Only needed once a call has failed, so the SDKs are not imported at startup
+    import openai
+    from azure.core.exceptions import HttpResponseError, ServiceRequestError, ServiceResponseError
+
+    if isinstance(exc, (openai.APIConnectionError, ServiceRequestError, ServiceResponseError, asyncio.TimeoutError)):
+        return True, None
+    status_code = getattr(exc, "status_code", None)
+    if isinstance(exc, (openai.APIStatusError, HttpResponseError)) and status_code in RETRYABLE_STATUS_CODES:
+        response = getattr(exc, "response", None)
+        return True, _retry_after_seconds(getattr(response, "headers", None))
+    return False, None
+
+
+class RequestScheduler:
+    """
+    Admits calls to one rate-limited service within its requests-per-minute
+    and tokens-per-minute budgets, highest priority first, and retries
+    throttled or failed calls.
+
+    Retries wait for the service's Retry-After when it sends one, otherwise
+    for a jittered exponential backoff. A 429 also pauses admission of every
+    other call to the service for that delay, so the quota is not hammered
+    while it recovers.
+    """
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        max_retries: int = None,
+        backoff_base: float = None,
+        backoff_max: float = None
+    ):
+        self.name = name
+        # Azure evaluates quotas over windows shorter than a minute, so bursts are capped too
+        self.requests = TokenBucket(requests_per_minute, Config.SCHEDULER_BURST_SECONDS)
+        self.tokens = TokenBucket(tokens_per_minute, Config.SCHEDULER_BURST_SECONDS)
+        self.max_retries = Config.SCHEDULER_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_base = Config.SCHEDULER_BACKOFF_BASE_SECONDS if backoff_base is None else backoff_base
+        self.backoff_max = Config.SCHEDULER_BACKOFF_MAX_SECONDS if backoff_max is None else backoff_max
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._blocked_until = 0.0
+        self._condition = None
+        self._loop = None
+        self.calls = 0
+        self.retries = 0
+        self.throttled = 0
+
+    async def submit(self, call: Callable[[], Awaitable], tokens: int = 1, priority: int = None):
+        """
+        Runs `call` once admitted, retrying it on throttling and transient errors.
+
+        Args:
+            call: Zero-argument callable returning a fresh awaitable per attempt.
+            tokens: Estimated tokens the call counts against the TPM budget.
+            priority: PRIORITY_HIGH, PRIORITY_NORMAL or PRIORITY_LOW. Defaults
+                to the current request_priority.
+
+        Returns:
+            The call's result.
+        """
+        priority = request_priority.get() if priority is None else priority
+        attempt = 0
+        while True:
+            await self._admit(tokens, priority)
+            self.calls += 1
+            count("azure_calls", service=self.name)
+            try:
+                return await call()
+            except Exception as e:
+                retryable, retry_after = classify_error(e)
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                delay = retry_after if retry_after is not None else random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                if getattr(e, "status_code", None) == 429:
+                    self.throttled += 1
+                    count("azure_throttled", service=self.name)
+                    await self._pause(delay)
+                logger.info("%s: retrying in %.2fs after %s (attempt %d)", self.name, delay, type(e).__name__, attempt + 1)
+                self.retries += 1
+                count("azure_retries", service=self.name)
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "waiting": len(self._waiters)
+        }
+
+    def _get_condition(self) -> asyncio.Condition:
+        # Created lazily, and per event loop, so the scheduler can be built outside a running loop
+        loop = asyncio.get_running_loop()
+        if self._condition is None or self._loop is not loop:
+            self._condition = asyncio.Condition()
+            self._loop = loop
+            self._waiters = []
+        return self._condition
+
+    async def _pause(self, delay: float):
+        condition = self._get_condition()
+        async with condition:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+            condition.notify_all()
+
+    def _admission_delay(self, tokens: int) -> float:
+        now = time.monotonic()
+        return max(
+            self._blocked_until - now,
+            self.requests.delay_for(1, now),
+            self.tokens.delay_for(tokens, now)
+        )
+
+    async def _admit(self, tokens: int, priority: int):
+        condition = self._get_condition()
+        ticket = (priority, next(self._sequence))
+        async with condition:
+            heapq.heappush(self._waiters, ticket)
+            try:
+                while True:
+                    timeout = None
+                    if self._waiters[0] == ticket:
+                        timeout = self._admission_delay(tokens)
+                        if timeout <= 0:
+                            heapq.heappop(self._waiters)
+                            now = time.monotonic()
+                            self.requests.consume(1, now)
+                            self.tokens.consume(tokens, now)
+                            condition.notify_all()
+                            return
+                    try:
+                        await asyncio.wait_for(condition.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+            except BaseException:
+                if ticket in self._waiters:
+                    self._waiters.remove(ticket)
+                    heapq.heapify(self._waiters)
+                    condition.notify_all()
+                raise
+
+
+@lru_cache(maxsize=None)
+def get_scheduler(service: str) -> RequestScheduler:
+    """
+    Returns the process-wide scheduler of a rate-limited service: "chat" and
+    "embeddings" (separate Azure OpenAI deployments, so separate quotas) or
+    "form_recognizer".
+    """
+    budgets = {
+        "chat": (Config.AZURE_OPENAI_CHAT_RPM, Config.AZURE_OPENAI_CHAT_TPM),
+        "embeddings": (Config.AZURE_OPENAI_EMBEDDING_RPM, Config.AZURE_OPENAI_EMBEDDING_TPM),
+        "form_recognizer": (Config.FORM_RECOGNIZER_RPM, 0)
+    }
+    if service not in budgets:
+        raise ValueError(f"Unknown scheduled service: {service}")
+    requests_per_minute, tokens_per_minute = budgets[service]
+    return RequestScheduler(service, requests_per_minute, tokens_per_minute)
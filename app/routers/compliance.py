@@ -1,49 +1,142 @@
-from fastapi import APIRouter, UploadFile, File
-from typing import List
-from app.services.ingestion_service import handle_expense_upload
-from app.services.policy_ingestion import handle_policy_upload
-from app.services.receipt_service import handle_receipt_batch
-from app.services.compliance_check import check_compliance
+import asyncio
+import json
+import shutil
+import tempfile
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+from app.core.metrics import request_summary
+from app.services.compliance_pipeline import run_compliance_pipeline, iter_compliance_pipeline, validate_policy_source
+from app.services.job_queue import submit_compliance_job, get_job_store, load_job_report, load_job_metrics
+from app.services.verdict_cache import get_verdict_cache
 
 router = APIRouter()
 
+RECEIPT_FILES = File(..., description="Receipt PDFs or images, or ZIP/TAR archives of them")
+
 @router.post("/check-compliance/")
 async def check_compliance_api(
     expense_file: UploadFile = File(...),
-    policy_file: UploadFile = File(...),
-    receipt_files: List[UploadFile] = File(...)
+    policy_file: Optional[UploadFile] = File(None),
+    receipt_files: List[UploadFile] = RECEIPT_FILES,
+    policy_id: Optional[str] = Form(None)
+):
+    report = await run_compliance_pipeline(expense_file, receipt_files, policy_file, policy_id)
+    return {"status": "success", "report": report, "metrics": request_summary()}
+
+
+STREAM_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
+
+def _detach_upload(file: UploadFile) -> UploadFile:
+    # Uploads are closed once the endpoint returns, before the streamed body is sent
+    if file is None:
+        return None
+    copy = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    file.file.seek(0)
+    shutil.copyfileobj(file.file, copy)
+    copy.seek(0)
+    return UploadFile(file=copy, filename=file.filename, headers=file.headers)
+
+
+def _detach_uploads(files: list) -> list:
+    return [_detach_upload(file) for file in files]
+
+
+def _stream_line(stream_format: str, event: str, payload: dict) -> str:
+    data = json.dumps(payload, default=str)
+    if stream_format == "sse":
+        return f"event: {event}\ndata: {data}\n\n"
+    return data + "\n"
+
+
+@router.post("/check-compliance/stream")
+async def stream_compliance_api(
+    expense_file: UploadFile = File(...),
+    policy_file: Optional[UploadFile] = File(None),
+    receipt_files: List[UploadFile] = RECEIPT_FILES,
+    policy_id: Optional[str] = Form(None),
+    stream_format: str = Query("ndjson", alias="format", description="ndjson or sse")
 ):
-    # Step 1: Get expense vectors
-    expense_data = await handle_expense_upload(expense_file)
-    print(f"Categories Data: {expense_data['categories']}")
-    # Step 2: Get policy vectors
-    policy_data = await handle_policy_upload(policy_file)
-    
-    # Step 3: Get receipt vectors
-    receipt_data = await handle_receipt_batch(receipt_files)
-    print(f"Receipt Data: {receipt_data}")
-
-    receipt_vector =[r["embedding"] for r in receipt_data["data"]]
-    print(f"Receipt Vectors: {receipt_vector}")
-
-    # Step 4: Run compliance check
-    report = await check_compliance(
-        expense_vectors=expense_data["record_vectors"],
-        receipt_vectors=[r["embedding"] for r in receipt_data["data"]],
-        policy_vectors=policy_data["chunk_vectors"],
-        record_ids=expense_data["record_ids"],
-        receipt_flags=expense_data["receipt_flags"],
-        receipt_ids=expense_data["receipt_ids"],
-        # receipt_name = receipt_data["filename"],
-        # receipt_names = receipt_data.get("filename", None),  # Use .get() to avoid KeyError
-        receipt_names = [r["filename"] for r in receipt_data["data"]],
-        expense_amounts=expense_data["receipt_amounts"],
-        # receipt_amount=receipt_data["amounts"]
-        receipt_amounts = [r["amount"] for r in receipt_data["data"]],  # Use .get() to avoid KeyError
-        # receipt_amounts = receipt_data.get("amount", None)  # Use .get() to avoid KeyError
-        policy_chunks=policy_data["chunks"],
-        categories=expense_data['categories']   
+    """
+    Streams each record's verdict as soon as it is known instead of buffering
+    the whole report. Every "record" line carries Record_Index, its position in
+    the expense file, since verdicts arrive in completion order. The stream ends
+    with a "done" line carrying the request's timing breakdown, or an "error"
+    line if the check fails part way.
+    """
+    if stream_format not in STREAM_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unsupported format '{stream_format}'. Use one of: {', '.join(STREAM_MEDIA_TYPES)}.")
+    validate_policy_source(policy_file, policy_id)
+    # Copying large uploads blocks, so it runs off the event loop
+    expense_file, policy_file, *receipt_files = await asyncio.to_thread(_detach_uploads, [expense_file, policy_file, *receipt_files])
+
+    async def events():
+        records = 0
+        try:
+            async for i, entry in iter_compliance_pipeline(expense_file, receipt_files, policy_file, policy_id):
+                records += 1
+                yield _stream_line(stream_format, "record", {"Record_Index": i, **entry})
+        except HTTPException as e:
+            yield _stream_line(stream_format, "error", {"status": "error", "detail": e.detail})
+            return
+        except Exception as e:
+            yield _stream_line(stream_format, "error", {"status": "error", "detail": str(e)})
+            return
+        finally:
+            for f in [expense_file, policy_file, *receipt_files]:
+                if f is not None:
+                    f.file.close()
+        yield _stream_line(stream_format, "done", {"status": "success", "records": records, "metrics": request_summary()})
+
+    return StreamingResponse(
+        events(),
+        media_type=STREAM_MEDIA_TYPES[stream_format],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
 
-    return {"status": "success", "report": report}
+
+@router.post("/jobs", status_code=202)
+async def submit_compliance_job_api(
+    expense_file: UploadFile = File(...),
+    policy_file: Optional[UploadFile] = File(None),
+    receipt_files: List[UploadFile] = RECEIPT_FILES,
+    policy_id: Optional[str] = Form(None)
+):
+    job_id = await submit_compliance_job(expense_file, receipt_files, policy_file, policy_id)
+    return {"status": "queued", "job_id": job_id}
+
+
+@router.get("/jobs/{job_id}")
+async def get_compliance_job(job_id: str):
+    job = await asyncio.to_thread(get_job_store().get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found.")
+    return {
+        "job_id": job_id,
+        "status": job["status"],
+        "stage": job["stage"],
+        "progress": job["progress"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"]
+    }
+
+
+@router.get("/jobs/{job_id}/report")
+async def get_compliance_job_report(job_id: str):
+    job = await asyncio.to_thread(get_job_store().get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found.")
+    if job["status"] != "completed":
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is {job['status']}; the report is available once it completes.")
+    return {"status": "success", "report": load_job_report(job_id), "metrics": load_job_metrics(job_id)}
+
+
+@router.get("/verdict-cache")
+async def verdict_cache_stats():
+    verdict_cache = get_verdict_cache()
+    if verdict_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **verdict_cache.stats()}
 #compliance
\ No newline at end of file
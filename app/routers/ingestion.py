@@ -1,12 +1,20 @@
-from typing import List
-from fastapi import APIRouter, UploadFile, File
+import asyncio
+from typing import List, Optional
+from fastapi import APIRouter, UploadFile, File, Query, HTTPException, Response
 from app.services.ingestion_service import (
+   EXPENSE_COLUMNS,
    handle_expense_upload,
    # handle_receipt_ocr,
    # handle_policy_ingestion
 )
 from app.services.policy_ingestion import handle_policy_upload
+from app.services.policy_store import list_policy_versions
 from app.services.receipt_service import handle_receipt_batch
+from app.core.embedding_cache import get_embedding_cache
+from app.services.receipt_cache import get_receipt_cache
+from app.core.metrics import request_summary
+from app.services.vector_store import save_vectors, load_vectors, vectors_to_npy
+from app.utils.vectors import check_quantize, vectors_to_json
 
 from fastapi import APIRouter, UploadFile, File
 
@@ -15,24 +23,114 @@ from fastapi import APIRouter, UploadFile, File
 # from app.services.report_service import generate_report
 
 router = APIRouter()
+
+# Services keep vectors as float32 matrices. Responses carry a stored-vectors handle
+# by default, and JSON lists only when the client asks for them with include_vectors.
+INCLUDE_VECTORS_QUERY = Query(False, description="Return the full vectors in the response instead of a vectors_id handle")
+QUANTIZE_QUERY = Query(None, description="With include_vectors, set to 'int8' to return int8 vector codes with per-row scales")
+
+def validate_quantize(quantize: Optional[str]):
+   # Checked before any work is done, so a typo does not cost a full ingestion
+   try:
+      check_quantize(quantize)
+   except ValueError as e:
+      raise HTTPException(status_code=400, detail=str(e))
+
+async def vector_fields(name: str, matrix, include_vectors: bool, quantize: Optional[str]) -> dict:
+   if include_vectors:
+      return {name: vectors_to_json(matrix, quantize)}
+   return {f"{name}_id": await asyncio.to_thread(save_vectors, matrix), f"{name}_count": len(matrix)}
+
 @router.post("/expense")
-async def upload_expense(file: UploadFile = File(...)):
-   print("request Reached")
-   return await handle_expense_upload(file)
+async def upload_expense(
+   file: UploadFile = File(...),
+   include_vectors: bool = INCLUDE_VECTORS_QUERY,
+   quantize: Optional[str] = QUANTIZE_QUERY
+):
+   validate_quantize(quantize)
+   expense_data = await handle_expense_upload(file)
+   for column in EXPENSE_COLUMNS:
+      expense_data[column] = expense_data[column].tolist()
+   expense_data.update(await vector_fields("record_vectors", expense_data.pop("record_vectors"), include_vectors, quantize))
+   expense_data["metrics"] = request_summary()
+   return expense_data
 
 
 
 @router.post("/policy")
-async def upload_policy(file: UploadFile = File(...)):
-   return await handle_policy_upload(file)
+async def upload_policy(
+   file: UploadFile = File(...),
+   base_policy_id: Optional[str] = Query(None, description="Policy version this upload amends. Defaults to the latest upload with the same filename"),
+   include_vectors: bool = INCLUDE_VECTORS_QUERY,
+   quantize: Optional[str] = QUANTIZE_QUERY
+):
+   validate_quantize(quantize)
+   policy_data = await handle_policy_upload(file, base_policy_id)
+   policy_data.update(await vector_fields("chunk_vectors", policy_data.pop("chunk_vectors"), include_vectors, quantize))
+   policy_data["metrics"] = request_summary()
+   return policy_data
+
+
+@router.get("/policy/{policy_id}/versions")
+async def get_policy_versions(policy_id: str):
+   try:
+      versions = list_policy_versions(policy_id)
+   except ValueError as e:
+      raise HTTPException(status_code=400, detail=str(e))
+   if versions is None:
+      raise HTTPException(status_code=404, detail=f"Policy {policy_id} not found.")
+   return {"policy_id": policy_id, "versions": versions}
  
  
 @router.post("/receipts")
-async def upload_receipts(files: List[UploadFile] = File(...)):  # Accept a single file
-    print("Processing receipt upload...")
-    return await handle_receipt_batch(files)  # Pass the file directly
- 
+async def upload_receipts(
+    files: List[UploadFile] = File(..., description="Receipt PDFs or images, or ZIP/TAR archives of them"),
+    engine: Optional[str] = Query(None, description="OCR engine: 'azure' or 'local'"),
+    include_vectors: bool = INCLUDE_VECTORS_QUERY,
+    quantize: Optional[str] = QUANTIZE_QUERY
+):
+    validate_quantize(quantize)
+    receipt_data = await handle_receipt_batch(files, engine)
+    for receipt in receipt_data["data"]:
+        if "embedding" in receipt:
+            receipt.update(await vector_fields("embedding", receipt.pop("embedding"), include_vectors, quantize))
+    receipt_data["metrics"] = request_summary()
+    return receipt_data
+
+
+@router.get("/vectors/{vectors_id}")
+async def get_vectors(
+    vectors_id: str,
+    format: str = Query("json", description="'json' for nested lists, or 'npy' for a NumPy .npy file"),
+    quantize: Optional[str] = QUANTIZE_QUERY
+):
+    validate_quantize(quantize)
+    try:
+        matrix = await asyncio.to_thread(load_vectors, vectors_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if matrix is None:
+        raise HTTPException(status_code=404, detail=f"Vectors {vectors_id} not found.")
+    if format == "npy":
+        return Response(
+            content=vectors_to_npy(matrix),
+            media_type="application/octet-stream",
+            headers={"Content-Disposition": f'attachment; filename="{vectors_id}.npy"'}
+        )
+    return {"vectors_id": vectors_id, "shape": list(matrix.shape), "vectors": vectors_to_json(matrix, quantize)}
 
 
+@router.get("/embedding-cache")
+async def embedding_cache_stats():
+    embedding_cache = get_embedding_cache()
+    if embedding_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **embedding_cache.stats()}
 
 
+@router.get("/receipt-cache")
+async def receipt_cache_stats():
+    receipt_cache = get_receipt_cache()
+    if receipt_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **receipt_cache.stats()}
@@ -1,9 +1,29 @@
 # 
-from app.core.azure_service_client import AzureOpenAIClient
-from sklearn.metrics.pairwise import cosine_similarity
-from openai import ChatCompletion
+import asyncio
+import logging
+from typing import AsyncIterator
+from app.core.azure_service_client import get_azure_openai_client
+from app.core.config.config import Config
+from app.core.metrics import count, timed
 import numpy as np
 import json
+from app.utils.vectors import to_matrix
+from app.services.policy_rules import evaluate_policy_rules
+from app.services.verdict_cache import get_verdict_cache, verdict_cache_key
+
+logger = logging.getLogger(__name__)
+
+COMPLIANCE_PROMPT_TEMPLATE = """
+You are an expense policy auditor. Given the following expense record and relevant policy terms, identify if any part of the record is non-compliant.
+ 
+    Expense Record:
+    {record}
+    Policies:
+    {policies}
+    # Return one of:
+    # - "Compliant"
+    # - "Non-compliant: <reason and which policy is violated>"
+    # """
  
 async def run_llm_compliance_check(record_data: dict, policy_chunks: list[str]) -> dict:
     """
@@ -16,25 +36,237 @@ async def run_llm_compliance_check(record_data: dict, policy_chunks: list[str])
     Returns:
         Dictionary containing the compliance result and explanation.
     """
-    azure_client = AzureOpenAIClient()
-    prompt = f"""
-You are an expense policy auditor. Given the following expense record and relevant policy terms, identify if any part of the record is non-compliant.
- 
-    Expense Record:
-    {json.dumps(record_data, indent=2)}
-    Policies:
-    {json.dumps(policy_chunks, indent=2)}
-    # Return one of:
-    # - "Compliant"
-    # - "Non-compliant: <reason and which policy is violated>"
-    # """
-    explanation =  azure_client.generate_completion(prompt)
+    azure_client = get_azure_openai_client()
+    prompt = COMPLIANCE_PROMPT_TEMPLATE.format(
+        record=json.dumps(record_data, indent=2),
+        policies=json.dumps(policy_chunks, indent=2)
+    )
+    with timed("judge"):
+        explanation = await azure_client.generate_completion(prompt)
     return {
         "record_id": record_data.get("receipt_id"),
         "compliance_result": explanation.strip()
     }
+
+BATCH_PROMPT_INSTRUCTIONS = """
+You are an expense policy auditor. Given the following expense records and relevant policy terms, identify for each record if any part of it is non-compliant.
+Each record lists, in "policy_refs", the numbers of the policies relevant to it.
+
+Respond with a JSON object mapping every record's receipt_id to its verdict, which must be one of:
+- "Compliant"
+- "Non-compliant: <reason and which policy is violated>"
+"""
+
+def _is_verdict(value) -> bool:
+    return isinstance(value, str) and value.strip().startswith(("Compliant", "Non-compliant"))
+
+def _build_batch_prompt(records: list[dict], policy_chunks: list[list[str]]) -> str:
+    # Each distinct policy chunk is included once and referenced by number
+    policy_numbers = {}
+    for chunks in policy_chunks:
+        for chunk in chunks:
+            policy_numbers.setdefault(chunk, len(policy_numbers) + 1)
+    batch_records = [
+        {**record_data, "policy_refs": [policy_numbers[chunk] for chunk in chunks]}
+        for record_data, chunks in zip(records, policy_chunks)
+    ]
+    policies = {number: chunk for chunk, number in policy_numbers.items()}
+    return f"""{BATCH_PROMPT_INSTRUCTIONS}
+Policies:
+{json.dumps(policies, indent=2)}
+Expense Records:
+{json.dumps(batch_records, indent=2, default=str)}
+"""
+
+async def run_llm_compliance_batch(records: list[dict], policy_chunks: list[list[str]]) -> dict:
+    """
+    Runs one LLM compliance check covering several expense records.
+
+    Args:
+        records: Expense record details, each with a receipt_id unique within the batch.
+        policy_chunks: The policy chunks relevant to each record.
+
+    Returns:
+        Dictionary mapping receipt_id to the well-formed verdicts the model
+        returned. Records with a missing or malformed verdict are left out.
+    """
+    azure_client = get_azure_openai_client()
+    prompt = _build_batch_prompt(records, policy_chunks)
+    with timed("judge"):
+        response = await azure_client.generate_completion(
+            prompt,
+            max_tokens=Config.JUDGE_BATCH_COMPLETION_TOKENS_PER_RECORD * len(records),
+            response_format={"type": "json_object"}
+        )
+    try:
+        verdicts = json.loads(response)
+    except (TypeError, ValueError):
+        return {}
+    if not isinstance(verdicts, dict):
+        return {}
+    return {
+        str(receipt_id): verdict.strip()
+        for receipt_id, verdict in verdicts.items()
+        if _is_verdict(verdict)
+    }
+
+def pack_judge_batches(records: list[dict], policy_chunks: list[list[str]]) -> list[list[int]]:
+    """
+    Groups records into batches whose prompts fit the judge token budget.
+
+    A batch holds at most JUDGE_BATCH_MAX_RECORDS records with distinct
+    receipt IDs, and is closed once adding the next record (and any policy
+    chunks it brings in) would exceed JUDGE_BATCH_MAX_PROMPT_TOKENS.
+
+    Returns:
+        Lists of record indices, one per batch, in record order.
+    """
+    encoding = get_azure_openai_client().encoding
+    base_tokens = len(encoding.encode(BATCH_PROMPT_INSTRUCTIONS))
+    chunk_tokens = {}
+    for chunks in policy_chunks:
+        for chunk in chunks:
+            if chunk not in chunk_tokens:
+                chunk_tokens[chunk] = len(encoding.encode(chunk))
+
+    batches = []
+    batch, batch_ids, batch_chunks, batch_tokens = [], set(), set(), base_tokens
+    for i, (record_data, chunks) in enumerate(zip(records, policy_chunks)):
+        receipt_id = str(record_data.get("receipt_id"))
+        record_tokens = len(encoding.encode(json.dumps(record_data, default=str)))
+        tokens = record_tokens + sum(chunk_tokens[c] for c in set(chunks) - batch_chunks)
+        if batch and (
+            len(batch) >= Config.JUDGE_BATCH_MAX_RECORDS
+            or receipt_id in batch_ids
+            or batch_tokens + tokens > Config.JUDGE_BATCH_MAX_PROMPT_TOKENS
+        ):
+            batches.append(batch)
+            batch, batch_ids, batch_chunks, batch_tokens = [], set(), set(), base_tokens
+            tokens = record_tokens + sum(chunk_tokens[c] for c in set(chunks))
+        batch.append(i)
+        batch_ids.add(receipt_id)
+        batch_chunks.update(chunks)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+def retrieve_policy_chunks(
+    record_vectors: list,
+    policy_vectors: list,
+    policy_chunks: list[str],
+    threshold: float,
+    top_k: int = None
+) -> list[list[str]]:
+    """
+    Selects the policy chunks relevant to each record.
+
+    Scores every record against every policy chunk in one cosine similarity
+    matrix and keeps, per record, the top-k chunks scoring at least `threshold`.
+    A record with no chunk above the threshold still gets its best-scoring
+    chunk, so the LLM is never asked to judge against an empty policy.
+
+    Args:
+        record_vectors: Embedding matrix of the records to judge.
+        policy_vectors: Embedding matrix of the policy chunks (same order as policy_chunks).
+        policy_chunks: List of policy text chunks.
+        threshold: Minimum similarity for a chunk to be included.
+        top_k: Maximum chunks per record. Defaults to Config.POLICY_TOP_K.
+
+    Returns:
+        One list of policy chunks per record, most relevant first.
+    """
+    if not len(record_vectors):
+        return []
+    if not len(policy_vectors) or len(policy_vectors) != len(policy_chunks):
+        # Without matching chunk vectors there is nothing to rank on
+        return [list(policy_chunks) for _ in record_vectors]
+
+    from sklearn.metrics.pairwise import cosine_similarity  # Deferred: sklearn takes over a second to import
+
+    top_k = min(top_k or Config.POLICY_TOP_K, len(policy_chunks))
+    scores = cosine_similarity(record_vectors, policy_vectors)
+    top_indices = np.argsort(-scores, axis=1)[:, :top_k]
+    top_scores = np.take_along_axis(scores, top_indices, axis=1)
+    relevant = top_scores >= threshold
+    relevant[:, :1] = True
+    return [
+        [policy_chunks[j] for j in indices[keep]]
+        for indices, keep in zip(top_indices, relevant)
+    ]
+
+async def _judge_record(record_data: dict, policy_chunks: list[str], semaphore: asyncio.Semaphore) -> str:
+    """
+    Runs one LLM compliance check under the shared concurrency cap, turning
+    failures into an error verdict so one record cannot abort the batch.
+    """
+    async with semaphore:
+        try:
+            llm_result = await run_llm_compliance_check(record_data, policy_chunks)
+            logger.debug("LLM result: %s", llm_result)
+            return llm_result.get("compliance_result", "Error: No result returned")
+        except Exception as e:
+            return f"Error: {str(e)}"
  
-async def check_compliance(
+def build_receipt_index(receipt_names: list) -> dict:
+    """
+    Maps each receipt name to the positions of the uploaded receipts carrying it.
+
+    More than one position means the same receipt ID was uploaded several times.
+    """
+    receipt_index = {}
+    for j, receipt_name in enumerate(receipt_names):
+        receipt_index.setdefault(receipt_name, []).append(j)
+    return receipt_index
+
+def _judge_records_batched(
+    records: list[dict],
+    policy_chunks: list[list[str]],
+    semaphore: asyncio.Semaphore
+) -> list:
+    """
+    Judges records several per prompt, falling back to one call per record
+    for any verdict the batch call did not return well-formed.
+
+    Returns:
+        One coroutine per batch, each resolving to (record position, verdict)
+        pairs so callers can consume batches as they finish.
+    """
+    async def judge_batch(indices: list[int]) -> list[tuple]:
+        async with semaphore:
+            try:
+                verdicts = await run_llm_compliance_batch(
+                    [records[i] for i in indices],
+                    [policy_chunks[i] for i in indices]
+                )
+            except Exception:
+                verdicts = {}
+        results = [verdicts.get(str(records[i].get("receipt_id"))) for i in indices]
+        fallback = [n for n, result in enumerate(results) if result is None]
+        fallback_results = await asyncio.gather(
+            *(_judge_record(records[indices[n]], policy_chunks[indices[n]], semaphore) for n in fallback)
+        )
+        for n, result in zip(fallback, fallback_results):
+            results[n] = result
+        return list(zip(indices, results))
+
+    return [judge_batch(indices) for indices in pack_judge_batches(records, policy_chunks)]
+
+def _judge_records_single(
+    records: list[dict],
+    policy_chunks: list[list[str]],
+    semaphore: asyncio.Semaphore
+) -> list:
+    """
+    One coroutine per record, resolving to a single (record position, verdict)
+    pair, matching the shape of _judge_records_batched.
+    """
+    async def judge_one(i: int) -> list[tuple]:
+        return [(i, await _judge_record(records[i], policy_chunks[i], semaphore))]
+
+    return [judge_one(i) for i in range(len(records))]
+ 
+async def iter_compliance(
     expense_vectors: list,
     receipt_vectors: list,
     policy_vectors: list,
@@ -46,16 +278,25 @@ async def check_compliance(
     receipt_amounts: list,
     policy_chunks: list,
     categories: list,
-    threshold: float = 0.8
-) -> list:
+    threshold: float = 0.8,
+    max_concurrency: int = None,
+    top_k: int = None,
+    judge_mode: str = None,
+    receipt_index: dict = None,
+    policy_rules: list = None,
+    receipt_errors: list = None
+) -> AsyncIterator[tuple[int, dict]]:
     """
     Compares each expense record and its corresponding receipt (if attached)
-    against the policy vectors using cosine similarity.
+    against the policy, sending each record to the LLM with only the policy
+    chunks retrieved for it by cosine similarity. Every record appears in the
+    report; records without exactly one matching receipt are reported as
+    non-compliant with the reason.
 
     Args:
-        expense_vectors: List of embeddings for each expense record.
-        receipt_vectors: List of embeddings for each receipt (same order as records).
-        policy_vectors: List of policy chunk embeddings.
+        expense_vectors: Embedding matrix with one row per expense record.
+        receipt_vectors: Chunk embedding matrices for each receipt.
+        policy_vectors: Embedding matrix of the policy chunks.
         record_ids: List of record IDs (e.g., EXP00001).
         receipt_flags: List of booleans indicating if a receipt is attached.
         receipt_ids: List of receipt IDs from the expense file.
@@ -64,33 +305,69 @@ async def check_compliance(
         receipt_amounts: List of receipt amounts extracted from the uploaded receipts.
         policy_chunks: List of policy text chunks.
         categories: List of categories for each expense record.
-        threshold: Similarity threshold for compliance.
+        threshold: Minimum record/policy chunk similarity for a chunk to be
+            included in the record's prompt.
+        max_concurrency: Maximum LLM checks in flight at once. Defaults to
+            Config.COMPLIANCE_MAX_CONCURRENCY; 1 judges records sequentially.
+        top_k: Maximum policy chunks per prompt. Defaults to Config.POLICY_TOP_K.
+        judge_mode: "single" for one LLM call per record, or "batch" to pack
+            several records into each call. Defaults to Config.COMPLIANCE_JUDGE_MODE.
+        receipt_index: Prebuilt build_receipt_index(receipt_names), for callers
+            checking one receipt batch against several expense chunks.
+        policy_rules: Rules extracted from the policy at ingest. Records they
+            decide skip the LLM (when Config.POLICY_RULES_ENABLED); None or an
+            empty list sends every record to the LLM.
+        receipt_errors: OCR error of each uploaded receipt (same order as
+            receipt_names), or None where it was read. A record whose receipt
+            failed is reported non-compliant with that error.
 
-    Returns:
-        List of compliance results with explanations.
+    Yields:
+        (record position, report entry) pairs as soon as each verdict is known:
+        records failing the deterministic checks first, then LLM verdicts in
+        completion order. Entries whose verdict was reused from the verdict
+        cache, or from an identical record in the same chunk, carry
+        "Cached": True.
     """
-    report = []
-
-    # Filter records to include only those with matching receipt IDs and receipt names
-    matching_records = [
-        i for i, receipt_id in enumerate(receipt_ids)
-        if receipt_id in receipt_names
-    ]
+    pending = []  # (report entry, LLM check, record position) judged concurrently below
+    policy_chunks = policy_chunks if policy_chunks else []
 
-    print(f"Matching Records: {matching_records}")  # Debugging log
+    # Join records to receipts through a hashed index instead of scanning receipt_names per record
+    if receipt_index is None:
+        receipt_index = build_receipt_index(receipt_names)
 
-    for i in matching_records:
-        expense_vector = expense_vectors[i]
+    for i, receipt_id in enumerate(receipt_ids):
         receipt_attached = receipt_flags[i]
-        receipt_id = receipt_ids[i]
         expense_amount = expense_amounts[i]
-        receipt_vector = receipt_vectors[receipt_names.index(receipt_id)] if receipt_attached else None
-        receipt_name = receipt_id  # Since we are filtering by matching receipt IDs
-        receipt_amount = receipt_amounts[receipt_names.index(receipt_id)] if receipt_attached else None
-        policy_chunks = policy_chunks if policy_chunks else []
-        category = categories[i] if categories and i < len(categories) else None
+        category = categories[i] if categories is not None and i < len(categories) else None
+        matches = receipt_index.get(receipt_id, [])
+
+        if len(matches) != 1:
+            if not receipt_attached:
+                explanation = "Receipt is not attached."
+            elif not matches:
+                explanation = f"No matching receipt found for Receipt ID {receipt_id}."
+            else:
+                explanation = f"Duplicate receipts found for Receipt ID {receipt_id}: {len(matches)} uploaded files share this ID."
+            yield i, {
+                "Record_ID": record_ids[i],
+                "Receipt_ID": receipt_id,
+                "Compliance": "Non-compliant",
+                "Explanation": explanation
+            }
+            continue
 
-        print(f"Processing Record ID: {record_ids[i]} with Receipt ID: {receipt_id}")  # Debugging log
+        receipt_error = receipt_errors[matches[0]] if receipt_errors else None
+        if receipt_attached and receipt_error:
+            yield i, {
+                "Record_ID": record_ids[i],
+                "Receipt_ID": receipt_id,
+                "Compliance": "Non-compliant",
+                "Explanation": f"Receipt for Receipt ID {receipt_id} could not be read: {receipt_error}"
+            }
+            continue
+
+        receipt_name = receipt_id
+        receipt_amount = receipt_amounts[matches[0]] if receipt_attached else None
 
         # Check if all conditions match
         if receipt_attached and receipt_amount == expense_amount:
@@ -102,33 +379,149 @@ async def check_compliance(
                 "expense_amount": expense_amount,
                 "categories": category
             }
-            try:
-                # Call the LLM compliance check function
-                llm_result = await run_llm_compliance_check(record_data, policy_chunks)
-                print(f"LLM Result: {llm_result}")  # Debugging log
-                compliance_result = llm_result.get("compliance_result", "Error: No result returned")
-            except Exception as e:
-                llm_result = {"compliance_result": f"Error: {str(e)}"}
-                compliance_result = f"Error: {str(e)}"
-            report.append({
+            entry = {
                 "Record_ID": record_ids[i],
                 "Receipt_ID": receipt_id,
-                "Compliance": llm_result.get("compliance_result", "Error: No result returned").split(":")[0].strip(),
-                "Explanation": llm_result.get("compliance_result", "Error: No result returned")
-            })
+                "Compliance": None,
+                "Explanation": None
+            }
+            pending.append((entry, record_data, i))
         else:
             mismatches = []
             if not receipt_attached:
                 mismatches.append("Receipt is not attached.")
             if receipt_amount != expense_amount:
                 mismatches.append(f"Amount mismatch: Expected {expense_amount}, got {receipt_amount}.")
-            report.append({
+            yield i, {
                 "Record_ID": record_ids[i],
                 "Receipt_ID": receipt_id,
                 "Compliance": "Non-compliant",
                 "Explanation": " | ".join(mismatches)
-            })
+            }
+
+    # Settle the clear-cut records from the policy rules and keep only the rest for the LLM
+    if policy_rules and Config.POLICY_RULES_ENABLED and pending:
+        decisions = evaluate_policy_rules(
+            policy_rules,
+            policy_chunks,
+            [record_data["categories"] for _, record_data, _ in pending],
+            [record_data["expense_amount"] for _, record_data, _ in pending]
+        )
+        undecided = []
+        for (entry, record_data, i), compliance_result in zip(pending, decisions):
+            if compliance_result is None:
+                undecided.append((entry, record_data, i))
+                continue
+            entry["Compliance"] = compliance_result.split(":")[0].strip()
+            entry["Explanation"] = compliance_result
+            yield i, entry
+        count("rule_decisions", len(pending) - len(undecided))
+        pending = undecided
+
+    if not pending:
+        return
+
+    # Retrieve the relevant policy chunks for all pending records in one pass
+    with timed("retrieve"):
+        record_policy_chunks = retrieve_policy_chunks(
+            to_matrix(expense_vectors)[[i for _, _, i in pending]],
+            policy_vectors,
+            policy_chunks,
+            threshold,
+            top_k
+        )
+
+    batch_mode = (judge_mode or Config.COMPLIANCE_JUDGE_MODE) == "batch"
+
+    # Reuse cached verdicts, and judge records sharing a cache key only once
+    verdict_cache = get_verdict_cache()
+    groups = {k: [k] for k in range(len(pending))}
+    if verdict_cache is not None:
+        prompt_template = BATCH_PROMPT_INSTRUCTIONS if batch_mode else COMPLIANCE_PROMPT_TEMPLATE
+        keys = [
+            verdict_cache_key(record_data, chunks, Config.AZURE_OPENAI_DEPLOYMENT_NAME, prompt_template)
+            for (_, record_data, _), chunks in zip(pending, record_policy_chunks)
+        ]
+        cached = await asyncio.to_thread(verdict_cache.get_many, keys)
+        by_key = {}
+        for k, key in enumerate(keys):
+            if key in cached:
+                entry, _, i = pending[k]
+                entry["Compliance"] = cached[key].split(":")[0].strip()
+                entry["Explanation"] = cached[key]
+                entry["Cached"] = True
+                yield i, entry
+            else:
+                by_key.setdefault(key, []).append(k)
+        groups = {members[0]: members for members in by_key.values()}
+
+    # Fan the LLM checks out with a concurrency cap and hand each verdict back as it lands
+    judged = list(groups)
+    semaphore = asyncio.Semaphore(max_concurrency or Config.COMPLIANCE_MAX_CONCURRENCY)
+    judge = _judge_records_batched if batch_mode else _judge_records_single
+    tasks = [
+        asyncio.ensure_future(job)
+        for job in judge(
+            [pending[k][1] for k in judged],
+            [record_policy_chunks[k] for k in judged],
+            semaphore
+        )
+    ]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            results = [(judged[n], compliance_result) for n, compliance_result in await next_done]
+            if verdict_cache is not None:
+                await asyncio.to_thread(verdict_cache.set_many, {
+                    keys[k]: compliance_result for k, compliance_result in results if _is_verdict(compliance_result)
+                })
+            for k, compliance_result in results:
+                for member in groups[k]:
+                    entry, _, i = pending[member]
+                    entry["Compliance"] = compliance_result.split(":")[0].strip()
+                    entry["Explanation"] = compliance_result
+                    if member != k:
+                        entry["Cached"] = True
+                    yield i, entry
+    finally:
+        # A consumer that stops early (e.g. a dropped stream) must not leave checks running
+        for task in tasks:
+            task.cancel()
+
+async def check_compliance(
+    expense_vectors: list,
+    receipt_vectors: list,
+    policy_vectors: list,
+    record_ids: list,
+    receipt_flags: list,
+    receipt_ids: list,
+    receipt_names: list,
+    expense_amounts: list,
+    receipt_amounts: list,
+    policy_chunks: list,
+    categories: list,
+    threshold: float = 0.8,
+    max_concurrency: int = None,
+    top_k: int = None,
+    judge_mode: str = None,
+    receipt_index: dict = None,
+    policy_rules: list = None,
+    receipt_errors: list = None
+) -> list:
+    """
+    Collects iter_compliance into a report in record order; see
+    iter_compliance for the arguments.
 
+    Returns:
+        List of compliance results with explanations, in record order.
+    """
+    report = [None] * len(receipt_ids)
+    async for i, entry in iter_compliance(
+        expense_vectors, receipt_vectors, policy_vectors, record_ids, receipt_flags,
+        receipt_ids, receipt_names, expense_amounts, receipt_amounts, policy_chunks,
+        categories, threshold, max_concurrency, top_k, judge_mode, receipt_index, policy_rules,
+        receipt_errors
+    ):
+        report[i] = entry
     return report
 # async def check_compliance(
 #     expense_vectors: list,
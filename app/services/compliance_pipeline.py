@@ -0,0 +1,121 @@
+import logging
+from typing import AsyncIterator
+from fastapi import UploadFile, HTTPException
+from app.services.ingestion_service import iter_expense_batches
+from app.services.policy_ingestion import handle_policy_upload, get_stored_policy
+from app.services.receipt_service import handle_receipt_batch
+from app.services.compliance_check import iter_compliance, build_receipt_index
+from app.utils.archive import is_archive
+
+logger = logging.getLogger(__name__)
+
+
+def _report_progress(progress, stage: str, **fields):
+    if progress is not None:
+        progress(stage, fields)
+
+
+def validate_policy_source(policy_file: UploadFile = None, policy_id: str = None):
+    if policy_file is None and not policy_id:
+        raise HTTPException(status_code=400, detail="Provide either policy_file or a policy_id from /ingest/policy.")
+
+
+async def iter_compliance_pipeline(
+    expense_file: UploadFile,
+    receipt_files: list[UploadFile],
+    policy_file: UploadFile = None,
+    policy_id: str = None,
+    progress=None
+) -> AsyncIterator[tuple[int, dict]]:
+    """
+    Runs the full compliance check: policy ingest, receipt OCR and embedding,
+    then expense ingest and judging chunk by chunk, handing back each record's
+    verdict as soon as it is known.
+
+    Args:
+        expense_file: Uploaded expense file.
+        receipt_files: Uploaded receipt files and ZIP or TAR receipt archives.
+        policy_file: Uploaded policy document, when no policy_id is given.
+        policy_id: ID of a policy previously ingested through /ingest/policy.
+        progress: Optional callable taking (stage, fields) as each stage advances.
+
+    Yields:
+        (record position in the expense file, report entry) pairs. Within an
+        expense chunk entries arrive in completion order, not record order.
+    """
+    validate_policy_source(policy_file, policy_id)
+
+    # Step 1: Get policy vectors, from the policy store when a policy_id is given
+    _report_progress(progress, "policy", status="running")
+    if policy_id:
+        policy_data = get_stored_policy(policy_id)
+    else:
+        policy_data = await handle_policy_upload(policy_file)
+    _report_progress(progress, "policy", status="completed", chunk_count=len(policy_data["chunks"]))
+
+    # Step 2: Get receipt vectors. An archive's receipt count is only known once it has been read
+    total_receipts = None if any(is_archive(f.filename) for f in receipt_files) else len(receipt_files)
+    _report_progress(progress, "receipts", status="running", done=0, total=total_receipts)
+    receipt_data = await handle_receipt_batch(
+        receipt_files,
+        on_receipt_done=lambda done: _report_progress(progress, "receipts", status="running", done=done, total=total_receipts)
+    )
+
+    # Receipts that failed OCR carry an error instead of an amount and embedding. They stay
+    # in the index so their records report the error rather than a missing receipt
+    receipts = receipt_data["data"]
+    receipt_vector =[r.get("embedding") for r in receipts]
+    receipt_names = [r["filename"] for r in receipts]
+    receipt_amounts = [r.get("amount") for r in receipts]
+    receipt_errors = [r.get("error") for r in receipts]
+    receipt_index = build_receipt_index(receipt_names)
+    total_receipts = len(receipts)
+    failed = sum(1 for error in receipt_errors if error)
+    logger.info("Receipts processed: %d, failed: %d", total_receipts - failed, failed)
+    _report_progress(progress, "receipts", status="completed", done=total_receipts, total=total_receipts, failed=failed)
+
+    # Step 3: Stream the expense file and run the compliance check chunk by chunk
+    records_checked = 0
+    _report_progress(progress, "compliance", status="running", records_checked=0)
+    async for expense_data in iter_expense_batches(expense_file):
+        offset = records_checked
+        async for i, entry in iter_compliance(
+            expense_vectors=expense_data["record_vectors"],
+            receipt_vectors=receipt_vector,
+            policy_vectors=policy_data["chunk_vectors"],
+            record_ids=expense_data["record_ids"],
+            receipt_flags=expense_data["receipt_flags"],
+            receipt_ids=expense_data["receipt_ids"],
+            receipt_names=receipt_names,
+            expense_amounts=expense_data["receipt_amounts"],
+            receipt_amounts=receipt_amounts,
+            policy_chunks=policy_data["chunks"],
+            categories=expense_data["categories"],
+            receipt_index=receipt_index,
+            policy_rules=policy_data.get("rules"),
+            receipt_errors=receipt_errors
+        ):
+            records_checked += 1
+            yield offset + i, entry
+        _report_progress(progress, "compliance", status="running", records_checked=records_checked)
+    _report_progress(progress, "compliance", status="completed", records_checked=records_checked)
+
+
+async def run_compliance_pipeline(
+    expense_file: UploadFile,
+    receipt_files: list[UploadFile],
+    policy_file: UploadFile = None,
+    policy_id: str = None,
+    progress=None
+) -> list:
+    """
+    Runs iter_compliance_pipeline to completion; see it for the arguments.
+
+    Returns:
+        The compliance report, one entry per expense record, in record order.
+    """
+    results = [
+        pair async for pair in iter_compliance_pipeline(expense_file, receipt_files, policy_file, policy_id, progress)
+    ]
+    results.sort(key=lambda pair: pair[0])
+    return [entry for _, entry in results]
@@ -1,46 +1,118 @@
-import pandas as pd
+import asyncio
+from typing import TYPE_CHECKING
 from fastapi import UploadFile, HTTPException
 from io import BytesIO
-from app.core.azure_service_client import AzureOpenAIClient
+from app.core.azure_service_client import get_azure_openai_client
 from app.core.config.config import Config
-from app.utils.parser import parse_expense_file
+from app.core.metrics import timed
+from app.utils.vectors import to_matrix
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Per-record columns returned by ingest_expense_frame, as NumPy arrays in record order
+EXPENSE_COLUMNS = ("record_ids", "receipt_flags", "receipt_amounts", "receipt_ids", "categories")
+
+def build_record_texts(df: "pd.DataFrame") -> list[str]:
+    """
+    Builds the text embedded for each expense record: its values joined by spaces.
+
+    Works column by column rather than row by row. Missing values are
+    written as "nan" whatever the column's dtype.
+    """
+    import pandas as pd
+
+    columns = [df[column].astype(object).where(df[column].notna(), "nan").to_numpy(dtype=str) for column in df.columns]
+    return pd.Series(columns[0]).str.cat(columns[1:], sep=" ").tolist()
+
+async def ingest_expense_frame(df: "pd.DataFrame") -> dict:
+    """
+    Embeds expense records and extracts the columns the compliance check needs.
+
+    Args:
+        df: Parsed expense records.
+
+    Returns:
+        Dictionary of the EXPENSE_COLUMNS as NumPy arrays, one entry per
+        record, plus the record vectors as a float32 matrix. Text columns are
+        object arrays of Python values, with None for a missing receipt ID.
+    """
+    import numpy as np
+
+    record_texts = build_record_texts(df)
+
+    # Fill the optional columns' defaults up front instead of per row
+    if "Receipt_Attached" in df:
+        receipt_flags = df["Receipt_Attached"].fillna(False).to_numpy(dtype=bool)
+    else:
+        receipt_flags = np.zeros(len(df), dtype=bool)
+    if "Receipt_ID" in df:
+        receipt_ids = df["Receipt_ID"].astype(object).where(df["Receipt_ID"].notna(), None).to_numpy(dtype=object)
+    else:
+        receipt_ids = np.full(len(df), None, dtype=object)
+
+    azure_service_client = get_azure_openai_client()
+    record_vectors = await azure_service_client.generate_embeddings(record_texts)
+    return {
+        "status": "success",
+        "record_count": len(record_vectors),
+        "record_vectors": record_vectors,
+        "record_ids": df["ID"].to_numpy(dtype=object),  # assuming 'ID' is the unique identifier
+        "receipt_flags": receipt_flags,
+        "receipt_amounts": df["Amount"].to_numpy(dtype=np.float64),
+        "receipt_ids": receipt_ids,
+        "categories": df["Category"].to_numpy(dtype=object)
+    }
+
+async def iter_expense_batches(file: UploadFile, chunk_size: int = None):
+    """
+    Streams an expense upload as ingested batches of at most `chunk_size` records.
+
+    Rows are parsed straight from the spooled upload file, so only one chunk
+    is held in memory at a time.
+
+    Args:
+        file: Uploaded CSV or Excel expense file.
+        chunk_size: Rows per batch. Defaults to Config.EXPENSE_CHUNK_SIZE.
+
+    Yields:
+        The ingest_expense_frame result for each chunk, in file order.
+    """
+    # pandas loads with the first expense upload (or the startup preload), not at app import
+    from app.utils.parser import iter_expense_chunks
 
-async def handle_expense_upload(file: UploadFile):
     try:
-        file_bytes = await file.read()
-        df = parse_expense_file(file_bytes, file.filename)
-
-        azure_service_client = AzureOpenAIClient()
-        record_vectors = []
-        record_ids = []
-        receipt_flags = []
-        receipt_amounts = []
-        receipt_ids=[]
-        categories = []
-
-        for _, row in df.iterrows():
-            record_text = " ".join(map(str, row.values))
-            embedding = azure_service_client.generate_embedding(record_text)
-            record_vectors.append(embedding)
-            record_ids.append(row["ID"])  # assuming 'ID' is the unique identifier
-            receipt_flags.append(row.get("Receipt_Attached", False))  # assuming 'Receipt Flag' is optional
-            receipt_amounts.append(row["Amount"])  # Assuming 'Amount' is the column name
-            receipt_ids.append(row.get("Receipt_ID", None))  # Assuming 'Receipt_ID' is optional
-            categories.append(row["Category"])  # Assuming 'Category' is optional
-        return {
-            "status": "success",
-            "record_count": len(record_vectors),
-            "record_vectors": record_vectors,
-            "record_ids": record_ids,
-            "receipt_flags": receipt_flags,
-            "receipt_amounts": receipt_amounts,
-            "receipt_ids": receipt_ids,
-            "categories": categories
-        }
+        chunks = iter_expense_chunks(file.file, file.filename, chunk_size or Config.EXPENSE_CHUNK_SIZE)
+        while True:
+            # Parsing is CPU-bound, so keep it off the event loop
+            with timed("parse"):
+                df = await asyncio.to_thread(next, chunks, None)
+            if df is None:
+                break
+            yield await ingest_expense_frame(df)
 
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Expense file error: {str(e)}")
 
+async def handle_expense_upload(file: UploadFile):
+    """
+    Ingests a whole expense file, joining its batches.
+
+    Returns:
+        Like ingest_expense_frame, for every record in the file. The columns
+        stay NumPy arrays; the router converts them to lists for the response.
+    """
+    import numpy as np
+
+    batches = []
+    async for batch in iter_expense_batches(file):
+        batches.append(batch)
+    expense_data = {"status": "success", "record_count": sum(batch["record_count"] for batch in batches)}
+    for column in EXPENSE_COLUMNS:
+        expense_data[column] = np.concatenate([batch[column] for batch in batches]) if batches else np.array([], dtype=object)
+    expense_data["record_vectors"] = np.concatenate([batch["record_vectors"] for batch in batches]) if batches else to_matrix([])
+    return expense_data
+
 
 
 
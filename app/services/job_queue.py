@@ -0,0 +1,381 @@
+import asyncio
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from functools import lru_cache
+from fastapi import UploadFile, HTTPException
+from app.core.config.config import Config
+from app.core.metrics import track_request
+from app.core.scheduler import request_priority, PRIORITY_LOW
+from app.services.compliance_pipeline import run_compliance_pipeline, validate_policy_source
+
+logger = logging.getLogger(__name__)
+
+
+class JobStore:
+    """
+    SQLite-backed queue of compliance jobs, shared by every worker process.
+
+    A running job whose heartbeat is older than JOB_STALE_SECONDS is treated
+    as abandoned (its worker died) and can be claimed again.
+
+    All methods block on SQLite, so async callers run them with asyncio.to_thread.
+    """
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY,"
+            " status TEXT NOT NULL,"
+            " stage TEXT,"
+            " progress TEXT NOT NULL DEFAULT '{}',"
+            " params TEXT NOT NULL,"
+            " error TEXT,"
+            " created_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL,"
+            " heartbeat_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_created_at ON jobs (status, created_at)")
+
+    def create(self, job_id: str, params: dict):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, params, created_at, updated_at) VALUES (?, 'queued', ?, ?, ?)",
+                (job_id, json.dumps(params), now, now)
+            )
+
+    def claim(self) -> dict:
+        """
+        Atomically marks the oldest queued (or abandoned) job as running.
+
+        Returns:
+            The claimed job, or None if there is nothing to run.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued'"
+                    " OR (status = 'running' AND heartbeat_at < ?)"
+                    " ORDER BY created_at LIMIT 1",
+                    (now - Config.JOB_STALE_SECONDS,)
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', updated_at = ?, heartbeat_at = ? WHERE id = ?",
+                        (now, now, row["id"])
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self._to_dict(row) if row is not None else None
+
+    def update_progress(self, job_id: str, stage: str, updates: dict):
+        """
+        Sets the job's current stage and merges `updates`, the latest fields
+        of each stage that changed, into its progress.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT progress FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            progress = json.loads(row["progress"]) if row else {}
+            progress.update(updates)
+            self._conn.execute(
+                "UPDATE jobs SET stage = ?, progress = ?, updated_at = ?, heartbeat_at = ? WHERE id = ?",
+                (stage, json.dumps(progress), now, now, job_id)
+            )
+
+    def heartbeat(self, job_id: str):
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ?", (time.time(), job_id))
+
+    def finish(self, job_id: str, status: str, error: str = None):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ?, heartbeat_at = NULL WHERE id = ?",
+                (status, error, now, job_id)
+            )
+
+    def purge(self, before: float) -> list[str]:
+        """
+        Deletes completed and failed jobs last updated before `before`.
+
+        Returns:
+            The IDs of the deleted jobs.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM jobs WHERE status IN ('completed', 'failed') AND updated_at < ?",
+                (before,)
+            ).fetchall()
+            job_ids = [row["id"] for row in rows]
+            self._conn.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in job_ids])
+        return job_ids
+
+    def get(self, job_id: str) -> dict:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row is not None else None
+
+    @staticmethod
+    def _to_dict(row) -> dict:
+        job = dict(row)
+        job["progress"] = json.loads(job["progress"])
+        job["params"] = json.loads(job["params"])
+        return job
+
+
+@lru_cache(maxsize=None)
+def get_job_store() -> JobStore:
+    return JobStore(Config.JOB_DB_PATH)
+
+
+def _job_dir(job_id: str) -> str:
+    return os.path.join(Config.JOBS_DIR, job_id)
+
+
+def _save_upload(file: UploadFile, directory: str, index: int) -> dict:
+    # Copy from the spooled upload file without reading it into memory
+    path = os.path.join(directory, f"{index:05d}_{os.path.basename(file.filename)}")
+    file.file.seek(0)
+    with open(path, "wb") as f:
+        shutil.copyfileobj(file.file, f)
+    return {"path": path, "filename": file.filename}
+
+
+def _save_job_inputs(job_id: str, expense_file: UploadFile, receipt_files: list[UploadFile], policy_file: UploadFile = None) -> dict:
+    inputs_dir = os.path.join(_job_dir(job_id), "inputs")
+    os.makedirs(inputs_dir)
+    return {
+        "expense_file": _save_upload(expense_file, inputs_dir, 0),
+        "receipt_files": [_save_upload(file, inputs_dir, i + 1) for i, file in enumerate(receipt_files)],
+        "policy_file": _save_upload(policy_file, inputs_dir, len(receipt_files) + 1) if policy_file is not None else None
+    }
+
+
+async def submit_compliance_job(
+    expense_file: UploadFile,
+    receipt_files: list[UploadFile],
+    policy_file: UploadFile = None,
+    policy_id: str = None
+) -> str:
+    """
+    Saves the uploads to local disk and queues a compliance run.
+
+    Returns:
+        The job ID, for polling /compliance/jobs/{job_id}.
+    """
+    validate_policy_source(policy_file, policy_id)
+
+    job_id = uuid.uuid4().hex
+    # Uploads can be large; copy them to disk off the event loop
+    params = await asyncio.to_thread(_save_job_inputs, job_id, expense_file, receipt_files, policy_file)
+    params["policy_id"] = policy_id
+    await asyncio.to_thread(get_job_store().create, job_id, params)
+    if _worker_pool is not None:
+        _worker_pool.wake()
+    return job_id
+
+
+def load_job_report(job_id: str) -> list:
+    with open(os.path.join(_job_dir(job_id), "report.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_job_metrics(job_id: str) -> dict:
+    """
+    Returns the timing breakdown and counters of a completed job's run, or
+    None for jobs completed before they were recorded.
+    """
+    try:
+        with open(os.path.join(_job_dir(job_id), "metrics.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _save_job_report(job_id: str, report: list, metrics: dict):
+    with open(os.path.join(_job_dir(job_id), "report.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, default=str)
+    with open(os.path.join(_job_dir(job_id), "metrics.json"), "w", encoding="utf-8") as f:
+        json.dump(metrics, f)
+
+
+def purge_finished_jobs() -> int:
+    """
+    Deletes finished jobs, with their reports, once Config.JOB_RETENTION_SECONDS
+    have passed since they ended. Blocks on disk I/O.
+
+    Returns:
+        The number of jobs deleted.
+    """
+    if Config.JOB_RETENTION_SECONDS <= 0:
+        return 0
+    job_ids = get_job_store().purge(time.time() - Config.JOB_RETENTION_SECONDS)
+    for job_id in job_ids:
+        shutil.rmtree(_job_dir(job_id), ignore_errors=True)
+    return len(job_ids)
+
+
+async def run_job(job: dict):
+    """
+    Runs a claimed compliance job and records its report, with the run's
+    stage timings and counters, or its error.
+    """
+    store = get_job_store()
+    job_id = job["id"]
+    params = job["params"]
+    opened = []
+    # Background jobs yield rate-limited quota to interactive requests
+    request_priority.set(PRIORITY_LOW)
+
+    def open_upload(saved: dict) -> UploadFile:
+        f = open(saved["path"], "rb")
+        opened.append(f)
+        return UploadFile(file=f, filename=saved["filename"])
+
+    # Progress arrives once per receipt and record; only the latest fields of each
+    # stage are kept and written at most once per JOB_PROGRESS_INTERVAL_SECONDS
+    pending = {}
+    current_stage = None
+    stopped = asyncio.Event()
+
+    def report_progress(stage: str, fields: dict):
+        nonlocal current_stage
+        current_stage = stage
+        pending[stage] = fields
+
+    async def write_progress():
+        # Each write also refreshes the heartbeat; with no progress, heartbeat on its own
+        last_write = time.monotonic()
+        while not stopped.is_set():
+            try:
+                await asyncio.wait_for(stopped.wait(), timeout=Config.JOB_PROGRESS_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            if pending:
+                updates = dict(pending)
+                pending.clear()
+                await asyncio.to_thread(store.update_progress, job_id, current_stage, updates)
+                last_write = time.monotonic()
+            elif time.monotonic() - last_write >= Config.JOB_HEARTBEAT_SECONDS:
+                await asyncio.to_thread(store.heartbeat, job_id)
+                last_write = time.monotonic()
+
+    progress_task = asyncio.ensure_future(write_progress())
+    try:
+        with track_request() as job_metrics:
+            report = await run_compliance_pipeline(
+                open_upload(params["expense_file"]),
+                [open_upload(saved) for saved in params["receipt_files"]],
+                open_upload(params["policy_file"]) if params["policy_file"] else None,
+                params["policy_id"],
+                progress=report_progress
+            )
+        await asyncio.to_thread(_save_job_report, job_id, report, job_metrics.summary())
+        status, error = "completed", None
+    except HTTPException as e:
+        status, error = "failed", str(e.detail)
+    except Exception as e:
+        status, error = "failed", str(e)
+    finally:
+        # The writer flushes the last progress and exits; it is not cancelled, so
+        # an in-flight write cannot land after the final status
+        stopped.set()
+        for f in opened:
+            f.close()
+
+    try:
+        await progress_task
+    except Exception:
+        logger.exception("Writing progress of compliance job %s failed", job_id)
+    await asyncio.to_thread(store.finish, job_id, status, error)
+
+    # The report is kept until purge_finished_jobs; the uploaded inputs are no longer needed
+    await asyncio.to_thread(shutil.rmtree, os.path.join(_job_dir(job_id), "inputs"), ignore_errors=True)
+
+
+class JobWorkerPool:
+    """
+    Background asyncio workers that claim and run queued compliance jobs, plus
+    a task that purges expired finished jobs.
+    """
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._tasks = []
+        self._wake = None
+
+    def start(self):
+        self._wake = asyncio.Event()
+        self._tasks = [asyncio.ensure_future(self._work()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.ensure_future(self._purge()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def wake(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _work(self):
+        store = get_job_store()
+        while True:
+            try:
+                job = await asyncio.to_thread(store.claim)
+            except Exception:
+                # e.g. the database stayed locked by another process; try again on the next poll
+                logger.exception("Claiming a compliance job failed")
+                job = None
+            if job is None:
+                # Other processes may queue jobs too, so poll as well as waiting for a local wake-up
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=Config.JOB_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await run_job(job)
+
+    async def _purge(self):
+        while True:
+            try:
+                purged = await asyncio.to_thread(purge_finished_jobs)
+                if purged:
+                    logger.info("Purged %d finished compliance jobs", purged)
+            except Exception:
+                logger.exception("Purging finished compliance jobs failed")
+            await asyncio.sleep(Config.JOB_PURGE_INTERVAL_SECONDS)
+
+
+_worker_pool = None
+
+
+async def start_job_workers():
+    global _worker_pool
+    if Config.JOB_WORKERS > 0 and _worker_pool is None:
+        _worker_pool = JobWorkerPool(Config.JOB_WORKERS)
+        _worker_pool.start()
+
+
+async def stop_job_workers():
+    global _worker_pool
+    if _worker_pool is not None:
+        await _worker_pool.stop()
+        _worker_pool = None
@@ -0,0 +1,84 @@
+import io
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from app.utils.receipt_extractdata import extract_receipt_id, extract_amount
+
+_process_pool = None
+
+
+def extract_receipt_local(content: bytes, filename: str) -> dict:
+    """
+    Extracts a receipt's text and fields without calling Form Recognizer.
+
+    PDFs use their PyMuPDF text layer and fall back to Tesseract OCR of the
+    rendered pages when it is empty. Images are OCR'd with Tesseract.
+    Runs in a worker process of the local OCR pool.
+
+    Args:
+        content: Raw receipt file bytes.
+        filename: Original receipt filename, used to detect the file type.
+
+    Returns:
+        Dictionary with the receipt ID, amount and extracted text.
+    """
+    # Imported here so only OCR worker processes pay for loading them
+    import fitz  # PyMuPDF
+    from pdf2image import convert_from_bytes
+    import pytesseract
+    from PIL import Image
+
+    filename = filename.lower()
+    if filename.endswith(".pdf"):
+        with fitz.open(stream=content, filetype="pdf") as doc:
+            text = "\n".join(page.get_text() for page in doc)
+        # Scanned PDFs have no text layer, so OCR the rendered pages instead
+        if not text.strip():
+            images = convert_from_bytes(content)
+            text = "\n".join(pytesseract.image_to_string(img) for img in images)
+    else:
+        image = Image.open(io.BytesIO(content)).convert("RGB")
+        text = pytesseract.image_to_string(image)
+
+    return {
+        "receipt_id": extract_receipt_id(text),
+        "amount": extract_amount(text),
+        "text": text
+    }
+
+
+def get_local_ocr_pool(max_workers: int = None) -> ProcessPoolExecutor:
+    """
+    Returns the process pool used for local OCR, creating it on first use.
+
+    Workers are spawned rather than forked, since the server process already
+    runs an event loop and thread pools.
+    """
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(
+            max_workers=max_workers or os.cpu_count(),
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _process_pool
+
+
+def discard_local_ocr_pool(pool: ProcessPoolExecutor):
+    """
+    Drops a pool that broke because a worker died (e.g. Tesseract or PyMuPDF
+    crashed on a file), so the next local OCR call starts a fresh one.
+    """
+    global _process_pool
+    if _process_pool is pool:
+        _process_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_local_ocr_pool():
+    """
+    Stops the local OCR workers, if they were started. Called on app shutdown.
+    """
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=True, cancel_futures=True)
+        _process_pool = None
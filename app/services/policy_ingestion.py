@@ -1,11 +1,16 @@
+import numpy as np
 from fastapi import UploadFile, HTTPException
-import fitz  # PyMuPDF
-import docx
 from io import BytesIO
-from app.core.azure_service_client import AzureOpenAIClient
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from app.core.azure_service_client import get_azure_openai_client
+from app.core.config.config import Config
+from app.core.metrics import timed
+from app.services.policy_store import compute_policy_id, compute_chunk_hashes, latest_policy_id, load_policy, save_policy
+from app.services.policy_rules import extract_policy_rules
+
+# Document parsers and the text splitter are imported on first use to keep startup fast
 
 def extract_text_from_pdf_bytes(file_bytes: bytes) -> str:
+    import fitz  # PyMuPDF
     text = ""
     with fitz.open(stream=file_bytes, filetype="pdf") as doc:
         for page in doc:
@@ -13,36 +18,136 @@ def extract_text_from_pdf_bytes(file_bytes: bytes) -> str:
     return text
 
 def extract_text_from_docx_bytes(file_bytes: bytes) -> str:
+    import docx
     doc = docx.Document(BytesIO(file_bytes))
     return "\n".join([para.text for para in doc.paragraphs])
 
-def embed_chunks(chunks):
-    azure_service_client = AzureOpenAIClient()
-    return [azure_service_client.generate_embedding(chunk) for chunk in chunks]
+async def embed_chunks(chunks):
+    azure_service_client = get_azure_openai_client()
+    return await azure_service_client.generate_embeddings(chunks)
+
+async def embed_changed_chunks(chunks: list[str], chunk_hashes: list[str], base_policy: dict = None):
+    """
+    Embeds only the chunks that are not in `base_policy`, reusing its stored
+    vectors for the rest.
+
+    Returns:
+        (chunk vector matrix, number of chunks embedded)
+    """
+    reusable = {}
+    if base_policy is not None and base_policy["embedding_model"] == Config.AZURE_OPENAI_EMBEDDING_MODEL_NAME:
+        reusable = dict(zip(base_policy["chunk_hashes"], base_policy["chunk_vectors"]))
+    changed = [i for i, chunk_hash in enumerate(chunk_hashes) if chunk_hash not in reusable]
+    if len(changed) == len(chunks):
+        return await embed_chunks(chunks), len(changed)
+
+    vectors = [reusable.get(chunk_hash) for chunk_hash in chunk_hashes]
+    if changed:
+        for i, vector in zip(changed, await embed_chunks([chunks[i] for i in changed])):
+            vectors[i] = vector
+    return np.stack(vectors), len(changed)
 
-async def handle_policy_upload(file: UploadFile):
+def extract_changed_rules(chunks: list[str], chunk_hashes: list[str], base_policy: dict = None) -> list[dict]:
+    """
+    Returns the same rules as extract_policy_rules(chunks), re-extracting only
+    the chunks that are not in `base_policy` and reusing its rules for the rest.
+    """
+    if base_policy is None:
+        return extract_policy_rules(chunks)
+    base_rules = {}
+    for rule in base_policy["rules"]:
+        base_rules.setdefault(base_policy["chunk_hashes"][rule["chunk"]], []).append(rule)
+    base_hashes = set(base_policy["chunk_hashes"])
+    rules = []
+    for i, (chunk, chunk_hash) in enumerate(zip(chunks, chunk_hashes)):
+        # Unchanged chunks, with or without rules, are not read again
+        chunk_rules = base_rules.get(chunk_hash, []) if chunk_hash in base_hashes else extract_policy_rules([chunk])
+        rules.extend({**rule, "chunk": i} for rule in chunk_rules)
+    return rules
+
+def get_stored_policy(policy_id: str) -> dict:
+    """
+    Returns a policy previously ingested through /ingest/policy.
+    """
+    try:
+        policy = load_policy(policy_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if policy is None:
+        raise HTTPException(status_code=404, detail=f"Policy {policy_id} not found. Upload it to /ingest/policy first.")
+    return policy
+
+async def handle_policy_upload(file: UploadFile, base_policy_id: str = None):
+    """
+    Ingests a policy document as a new version of an earlier one.
+
+    Chunks whose text is unchanged from the base version keep their stored
+    vectors and rules; only new or edited chunks are embedded and re-read for
+    rules. Cached verdicts are keyed by the text of the chunks a record
+    retrieves, so only records retrieving an edited chunk are judged again.
+
+    Args:
+        file: Uploaded PDF or DOCX policy.
+        base_policy_id: Version to update. Defaults to the latest policy
+            uploaded under the same filename.
+    """
+    if base_policy_id:
+        get_stored_policy(base_policy_id)
     try:
         file_bytes = await file.read()
 
-        if file.filename.endswith(".pdf"):
-            text = extract_text_from_pdf_bytes(file_bytes)
-        elif file.filename.endswith(".docx"):
-            text = extract_text_from_docx_bytes(file_bytes)
-        else:
-            raise ValueError("Unsupported file format. Please upload a PDF or DOCX file.")
-      
-        text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-            model_name="gpt-4", chunk_size=200, chunk_overlap=50, separators='\n\n'
-        )
+        # The same document was already ingested, so reuse its stored chunks and vectors
+        policy_id = compute_policy_id(file_bytes)
+        policy = load_policy(policy_id)
+        if policy is not None:
+            return {
+                "status": "success",
+                "policy_id": policy_id,
+                "version": policy["version"],
+                "parent_policy_id": policy["parent_policy_id"],
+                "chunk_count": len(policy["chunks"]),
+                "embedded_chunk_count": 0,
+                "chunks": policy["chunks"],
+                "chunk_vectors": policy["chunk_vectors"],
+                "rules": policy["rules"]
+            }
+
+        base_policy_id = base_policy_id or latest_policy_id(file.filename)
+        base_policy = load_policy(base_policy_id) if base_policy_id else None
+        if base_policy is None:
+            base_policy_id = None
+
+        with timed("parse"):
+            if file.filename.endswith(".pdf"):
+                text = extract_text_from_pdf_bytes(file_bytes)
+            elif file.filename.endswith(".docx"):
+                text = extract_text_from_docx_bytes(file_bytes)
+            else:
+                raise ValueError("Unsupported file format. Please upload a PDF or DOCX file.")
+
+            from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+            text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+                model_name="gpt-4", chunk_size=200, chunk_overlap=50, separators='\n\n'
+            )
 
-        chunks = text_splitter.split_text(text)
-        chunk_vectors = embed_chunks(chunks)
+            chunks = text_splitter.split_text(text)
+        chunk_hashes = compute_chunk_hashes(chunks)
+        chunk_vectors, embedded_count = await embed_changed_chunks(chunks, chunk_hashes, base_policy)
+        # Extract structured limits once here so compliance checks can skip clear-cut records
+        rules = extract_changed_rules(chunks, chunk_hashes, base_policy)
+        policy = save_policy(policy_id, file.filename, chunks, chunk_vectors, rules, base_policy_id)
 
         return {
             "status": "success",
+            "policy_id": policy_id,
+            "version": policy["version"],
+            "parent_policy_id": policy["parent_policy_id"],
             "chunk_count": len(chunks),
+            "embedded_chunk_count": embedded_count,
             "chunks": chunks,
-            "chunk_vectors": chunk_vectors
+            "chunk_vectors": chunk_vectors,
+            "rules": rules
         }
 
     except Exception as e:
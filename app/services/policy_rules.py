@@ -0,0 +1,247 @@
+import math
+import re
+import numpy as np
+from app.core.config.config import Config
+
+# Rules are extracted once per policy at ingest time and stored next to its chunks.
+# Each rule is a dict:
+#   {"type": "cap", "category": "meals", "cap": 50.0, "currency": "USD", "period": "day", "chunk": 3}
+#   {"type": "receipt_required", "category": None, "over": 25.0, "currency": "USD", "chunk": 7}
+
+_CURRENCIES = {
+    "$": "USD", "usd": "USD", "dollar": "USD", "dollars": "USD",
+    "€": "EUR", "eur": "EUR", "euro": "EUR", "euros": "EUR",
+    "£": "GBP", "gbp": "GBP",
+    "₹": "INR", "inr": "INR", "rs": "INR", "rs.": "INR", "rupees": "INR"
+}
+
+_AMOUNT = r"\d[\d,]*(?:\.\d+)?"
+_MONEY_PATTERN = re.compile(
+    rf"(?:(?P<pre>[$€£₹]|\b(?:USD|EUR|GBP|INR|Rs\.?))\s?(?P<amount>{_AMOUNT})"
+    rf"|(?P<amount2>{_AMOUNT})\s?(?P<post>USD|EUR|GBP|INR|dollars|euros|rupees)\b)",
+    re.IGNORECASE
+)
+_CAP_PATTERN = re.compile(
+    r"\b(?:up to|not (?:to )?exceed|shall not exceed|must not exceed|no more than|maximum(?: of)?|max(?:imum)?"
+    r"|limit(?:ed)? (?:of|to|is)|capped at|cap (?:of|is))\b",
+    re.IGNORECASE
+)
+_RECEIPT_PATTERN = re.compile(
+    r"\breceipts?\b.*?\b(?:required|mandatory|must be (?:submitted|attached|provided))\b"
+    r"|\b(?:require|requires|submit|attach|provide)\b.*?\breceipts?\b",
+    re.IGNORECASE
+)
+_OVER_PATTERN = re.compile(r"\b(?:over|above|exceeding|more than|greater than|in excess of)\s*$", re.IGNORECASE)
+_PERIOD_PATTERN = re.compile(r"\bper (day|night|person|trip|month|week)\b|\b(daily|nightly|monthly|weekly)\b", re.IGNORECASE)
+_LABEL_PATTERN = re.compile(r"^\s*(?:[-•*]|\d+[.)])?\s*(?P<category>[A-Za-z][A-Za-z &/]{1,40}?)\s*[:–-]\s")
+_SUBJECT_PATTERN = re.compile(
+    r"^\s*(?:[-•*]|\d+[.)])?\s*(?:the |all )?(?P<category>[A-Za-z][A-Za-z &/]{1,40}?)\s+"
+    r"(?:expenses?\s+|costs?\s+|claims?\s+)?(?:are|is|will be|should|must|can|may|shall)\b",
+    re.IGNORECASE
+)
+_LEADING_PATTERN = re.compile(
+    rf"^\s*(?:[-•*]|\d+[.)])?\s*(?:the |all )?(?P<category>[A-Za-z][A-Za-z &/]{{1,40}}?)\s+(?:{_CAP_PATTERN.pattern})",
+    re.IGNORECASE
+)
+_FOR_PATTERN = re.compile(
+    r"\b(?:for|on) (?:the |all )?(?P<category>[a-z][a-z &/]{1,30}?)\s*(?:expenses?\b|costs?\b|is\b|are\b|per\b|,|$)",
+    re.IGNORECASE
+)
+_NOT_CATEGORIES = {"reimbursement", "reimbursements", "amount", "claim", "claims", "expense", "expenses", "employee", "employees", "all", "it", "this", "each", "any", "total"}
+_PERIOD_NAMES = {"daily": "day", "nightly": "night", "monthly": "month", "weekly": "week"}
+
+
+def _tokens(text: str) -> frozenset:
+    """
+    Lowercase word stems of a category, so "Meals" matches "meal" and "Client meals".
+    """
+    words = re.findall(r"[a-z]+", (text or "").lower())
+    return frozenset(w[:-1] if len(w) > 3 and w.endswith("s") else w for w in words if w not in ("and", "the", "for", "of", "expense", "expenses"))
+
+
+def _parse_money(match) -> tuple:
+    amount = float((match.group("amount") or match.group("amount2")).replace(",", ""))
+    symbol = (match.group("pre") or match.group("post") or "").lower()
+    return amount, _CURRENCIES.get(symbol)
+
+
+def _sentence_category(sentence: str) -> str:
+    for pattern in (_LABEL_PATTERN, _SUBJECT_PATTERN, _LEADING_PATTERN, _FOR_PATTERN):
+        match = pattern.search(sentence)
+        if match:
+            category = match.group("category").strip().lower()
+            # "The maximum reimbursement for taxi fares is ..." names the category after "for"
+            if category in _NOT_CATEGORIES or _CAP_PATTERN.search(category) or re.search(r"reimburs|receipt", category):
+                continue
+            if _tokens(category):
+                return category
+    return None
+
+
+def extract_policy_rules(policy_chunks: list[str]) -> list[dict]:
+    """
+    Extracts per-category amount caps and receipt-required thresholds from the
+    policy text with pattern matching.
+
+    Only sentences stating a limit next to an amount produce a rule; anything
+    the patterns cannot read is left for the LLM to interpret.
+
+    Args:
+        policy_chunks: List of policy text chunks.
+
+    Returns:
+        List of rule dicts, possibly empty.
+    """
+    rules = []
+    for chunk_index, chunk in enumerate(policy_chunks or []):
+        for sentence in re.split(r"(?<=[.;])\s+|\n+", chunk):
+            money = list(_MONEY_PATTERN.finditer(sentence))
+            if not money:
+                continue
+
+            if _RECEIPT_PATTERN.search(sentence):
+                for match in money:
+                    if _OVER_PATTERN.search(sentence[:match.start()]):
+                        amount, currency = _parse_money(match)
+                        rules.append({
+                            "type": "receipt_required",
+                            "category": _sentence_category(sentence),
+                            "over": amount,
+                            "currency": currency,
+                            "chunk": chunk_index
+                        })
+                        break
+                continue
+
+            limit = _CAP_PATTERN.search(sentence)
+            if not limit:
+                continue
+            cap_match = next((m for m in money if m.start() >= limit.start()), None)
+            if cap_match is None:
+                continue
+            category = _sentence_category(sentence)
+            if category is None:
+                continue
+            amount, currency = _parse_money(cap_match)
+            period = _PERIOD_PATTERN.search(sentence[cap_match.end():])
+            rules.append({
+                "type": "cap",
+                "category": category,
+                "cap": amount,
+                "currency": currency,
+                "period": (period.group(1) or _PERIOD_NAMES.get(period.group(2).lower())).lower() if period else None,
+                "chunk": chunk_index
+            })
+    return rules
+
+
+def _category_label(category) -> str:
+    """
+    Returns a record's category as text, or "" when it is missing. pandas
+    reads a blank cell as NaN (or pd.NA), which must not become the category "nan".
+    """
+    if category is None or (isinstance(category, float) and math.isnan(category)):
+        return ""
+    label = str(category).strip()
+    return "" if label.lower() in ("nan", "<na>", "none") else label
+
+
+def _category_cap(category: str, cap_rules: list[dict], policy_text: str, uncapped: list[frozenset]) -> tuple:
+    """
+    Resolves the cap applying to one expense category.
+
+    A category with no matching cap may still be a synonym of a capped one
+    ("Lodging" for "Hotel stays"), so it is only settled as uncapped when it is
+    on the configured allow-list and the policy never mentions it.
+
+    Returns:
+        ("cap", rule) for a single unambiguous cap, ("unlimited", None) for an
+        allow-listed category the policy never mentions, or ("ambiguous", None)
+        otherwise.
+    """
+    category_tokens = _tokens(category)
+    if not category_tokens:
+        return "ambiguous", None
+    matching = [
+        rule for rule in cap_rules
+        if _tokens(rule["category"]) <= category_tokens or category_tokens <= _tokens(rule["category"])
+    ]
+    if not matching:
+        if category_tokens not in uncapped:
+            return "ambiguous", None
+        mentioned = any(re.search(rf"\b{re.escape(token)}", policy_text) for token in category_tokens)
+        return ("ambiguous", None) if mentioned else ("unlimited", None)
+    if len({(rule["cap"], rule["currency"], rule["period"]) for rule in matching}) != 1:
+        return "ambiguous", None
+    return "cap", matching[0]
+
+
+def evaluate_policy_rules(
+    rules: list[dict],
+    policy_chunks: list[str],
+    categories: list,
+    amounts: list,
+    margin: float = None
+) -> list:
+    """
+    Decides records whose verdict follows directly from the extracted rules, in
+    one vectorized pass over the records.
+
+    A record is decided when its amount is clearly below its category cap,
+    when it is clearly above a cap that applies per expense, or when its
+    category is in Config.POLICY_UNCAPPED_CATEGORIES and never mentioned in the
+    policy. Amounts within `margin` of a cap, per-day style caps that are
+    exceeded, missing categories, categories without a matching cap, and
+    categories with conflicting or unreadable limits stay undecided.
+
+    Args:
+        rules: Rules from extract_policy_rules.
+        policy_chunks: List of policy text chunks the rules came from.
+        categories: Category of each record.
+        amounts: Expense amount of each record.
+        margin: Relative band around a cap left to the LLM. Defaults to
+            Config.RULE_AMBIGUITY_MARGIN.
+
+    Returns:
+        One verdict string ("Compliant: ..." / "Non-compliant: ...") per record,
+        or None for records the LLM still has to judge. All None when no caps
+        were extracted from the policy.
+    """
+    decisions = [None] * len(amounts)
+    cap_rules = [rule for rule in rules or [] if rule["type"] == "cap"]
+    if not cap_rules or not decisions:
+        return decisions
+    margin = Config.RULE_AMBIGUITY_MARGIN if margin is None else margin
+
+    # Resolve each distinct category once, then broadcast the caps over the records
+    # Missing categories resolve to "ambiguous" and are left to the LLM
+    labels = np.array([_category_label(c) for c in categories], dtype=object)
+    unique_labels, inverse = np.unique(labels, return_inverse=True)
+    policy_text = " ".join(policy_chunks or []).lower()
+    uncapped = [_tokens(category) for category in Config.POLICY_UNCAPPED_CATEGORIES]
+    resolved = [_category_cap(label, cap_rules, policy_text, uncapped) for label in unique_labels]
+
+    kinds = np.array([kind for kind, _ in resolved], dtype=object)[inverse]
+    caps = np.array([rule["cap"] if rule else np.nan for _, rule in resolved], dtype=np.float64)[inverse]
+    per_expense = np.array([bool(rule) and rule["period"] is None for _, rule in resolved])[inverse]
+    amounts = np.asarray(amounts, dtype=np.float64)
+
+    with np.errstate(invalid="ignore"):
+        below = (kinds == "cap") & (amounts <= caps * (1 - margin))
+        above = (kinds == "cap") & per_expense & (amounts > caps * (1 + margin))
+    unlimited = (kinds == "unlimited") & ~np.isnan(amounts)
+
+    for i in np.flatnonzero(below | above | unlimited):
+        category = labels[i]
+        rule = resolved[inverse[i]][1]
+        if unlimited[i]:
+            decisions[i] = f"Compliant: The policy sets no limit for {category} expenses (policy rule)."
+            continue
+        cap = f"{rule['cap']:g}" + (f" {rule['currency']}" if rule["currency"] else "")
+        if rule["period"]:
+            cap += f" per {rule['period']}"
+        if below[i]:
+            decisions[i] = f"Compliant: Amount {amounts[i]:g} is within the {category} cap of {cap} (policy rule)."
+        else:
+            decisions[i] = f"Non-compliant: Amount {amounts[i]:g} exceeds the {category} cap of {cap} (policy rule)."
+    return decisions
@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import numpy as np
+from app.core.config.config import Config
+from app.services.policy_rules import extract_policy_rules
+
+# Policies loaded by this worker, keyed by policy ID
+_policy_cache = {}
+
+_POLICY_ID_PATTERN = re.compile(r"[0-9a-f]{64}")
+
+
+def compute_policy_id(file_bytes: bytes) -> str:
+    """
+    Returns the content-hash ID of an uploaded policy document.
+    """
+    return hashlib.sha256(file_bytes).hexdigest()
+
+
+def compute_chunk_hashes(chunks: list[str]) -> list[str]:
+    """
+    Returns the content hash of each policy chunk, used to match unchanged
+    chunks between versions of a policy.
+    """
+    return [hashlib.sha256(chunk.encode("utf-8")).hexdigest() for chunk in chunks]
+
+
+def _policy_dir(policy_id: str) -> str:
+    if not _POLICY_ID_PATTERN.fullmatch(policy_id or ""):
+        raise ValueError(f"Invalid policy ID: {policy_id}")
+    return os.path.join(Config.POLICY_STORE_DIR, policy_id)
+
+
+def _latest_path(filename: str) -> str:
+    # Versions of a policy are linked by filename; the pointer names the newest one
+    key = hashlib.sha256(filename.encode("utf-8")).hexdigest()
+    return os.path.join(Config.POLICY_STORE_DIR, "latest", f"{key}.json")
+
+
+def latest_policy_id(filename: str) -> str:
+    """
+    Returns the ID of the most recently ingested policy uploaded as `filename`, or None.
+    """
+    try:
+        with open(_latest_path(filename), encoding="utf-8") as f:
+            return json.load(f)["policy_id"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _set_latest_policy_id(filename: str, policy_id: str):
+    path = _latest_path(filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump({"policy_id": policy_id}, f)
+    os.replace(tmp_path, path)
+
+
+def save_policy(
+    policy_id: str,
+    filename: str,
+    chunks: list[str],
+    chunk_vectors: list,
+    rules: list[dict] = None,
+    parent_policy_id: str = None
+) -> dict:
+    """
+    Persists a policy's chunks, chunk vectors and extracted rules and caches them in memory.
+
+    Args:
+        policy_id: Content-hash ID of the policy document.
+        filename: Original policy filename.
+        chunks: List of policy text chunks.
+        chunk_vectors: List of embeddings for each chunk.
+        rules: Rules from extract_policy_rules. Extracted from the chunks when omitted.
+        parent_policy_id: ID of the previous version of this policy, if any.
+
+    Returns:
+        The stored policy.
+    """
+    policy_dir = _policy_dir(policy_id)
+    os.makedirs(Config.POLICY_STORE_DIR, exist_ok=True)
+    parent = load_policy(parent_policy_id) if parent_policy_id else None
+
+    # Write into a temporary directory and rename it, so other workers never see a partial policy
+    tmp_dir = tempfile.mkdtemp(dir=Config.POLICY_STORE_DIR)
+    try:
+        with open(os.path.join(tmp_dir, "chunks.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "filename": filename,
+                "chunks": chunks,
+                "chunk_hashes": compute_chunk_hashes(chunks),
+                "embedding_model": Config.AZURE_OPENAI_EMBEDDING_MODEL_NAME,
+                "version": parent["version"] + 1 if parent else 1,
+                "parent_policy_id": parent_policy_id if parent else None
+            }, f)
+        np.save(os.path.join(tmp_dir, "vectors.npy"), np.asarray(chunk_vectors, dtype=np.float32))
+        with open(os.path.join(tmp_dir, "rules.json"), "w", encoding="utf-8") as f:
+            json.dump(extract_policy_rules(chunks) if rules is None else rules, f)
+        os.replace(tmp_dir, policy_dir)
+    except OSError:
+        # Another worker stored the same policy first
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if not os.path.isdir(policy_dir):
+            raise
+
+    _set_latest_policy_id(filename, policy_id)
+    return load_policy(policy_id)
+
+
+def load_policy(policy_id: str) -> dict:
+    """
+    Returns a stored policy, reading it from disk only on first use in this worker.
+
+    Args:
+        policy_id: Content-hash ID of the policy document.
+
+    Returns:
+        Dictionary with the policy ID, filename, chunks, chunk hashes, chunk
+        vectors (a float32 matrix), rules, version and parent policy ID, or
+        None if the policy has not been ingested.
+    """
+    if policy_id in _policy_cache:
+        return _policy_cache[policy_id]
+
+    policy_dir = _policy_dir(policy_id)
+    if not os.path.isdir(policy_dir):
+        return None
+
+    with open(os.path.join(policy_dir, "chunks.json"), encoding="utf-8") as f:
+        stored = json.load(f)
+    rules_path = os.path.join(policy_dir, "rules.json")
+    if os.path.exists(rules_path):
+        with open(rules_path, encoding="utf-8") as f:
+            rules = json.load(f)
+    else:
+        # Stored before rule extraction existed
+        rules = extract_policy_rules(stored["chunks"])
+    policy = {
+        "policy_id": policy_id,
+        "filename": stored["filename"],
+        "chunks": stored["chunks"],
+        "chunk_hashes": stored.get("chunk_hashes") or compute_chunk_hashes(stored["chunks"]),
+        "chunk_vectors": np.load(os.path.join(policy_dir, "vectors.npy")),
+        "rules": rules,
+        # Policies stored before versioning have no recorded model, so their vectors are never reused
+        "embedding_model": stored.get("embedding_model"),
+        "version": stored.get("version", 1),
+        "parent_policy_id": stored.get("parent_policy_id")
+    }
+    _policy_cache[policy_id] = policy
+    return policy
+
+
+def list_policy_versions(policy_id: str) -> list[dict]:
+    """
+    Returns the version history ending at `policy_id`, newest first, or None
+    if the policy has not been ingested.
+    """
+    versions = []
+    policy = load_policy(policy_id)
+    if policy is None:
+        return None
+    while policy is not None:
+        versions.append({
+            "policy_id": policy["policy_id"],
+            "version": policy["version"],
+            "filename": policy["filename"],
+            "chunk_count": len(policy["chunks"])
+        })
+        policy = load_policy(policy["parent_policy_id"]) if policy["parent_policy_id"] else None
+    return versions
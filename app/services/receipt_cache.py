@@ -0,0 +1,157 @@
+import asyncio
+import base64
+import hashlib
+import io
+import json
+from functools import lru_cache
+import numpy as np
+from app.core.config.config import Config
+from app.core.disk_cache import DiskCache
+from app.core.metrics import count
+from app.utils.vectors import to_matrix
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tiff", "jfif")
+
+
+def receipt_content_hash(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def receipt_perceptual_hash(content: bytes, filename: str) -> int:
+    """
+    Returns the 64-bit difference hash (dHash) of an image receipt, which
+    stays the same or nearly so when a photo is re-encoded, resized or
+    slightly recompressed. Returns None for PDFs and unreadable images.
+    """
+    if not filename.lower().endswith(IMAGE_EXTENSIONS):
+        return None
+    from PIL import Image
+
+    try:
+        with Image.open(io.BytesIO(content)) as image:
+            pixels = np.asarray(image.convert("L").resize((9, 8), Image.LANCZOS), dtype=np.int16)
+    except Exception:
+        return None
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int("".join("1" if bit else "0" for bit in bits), 2)
+
+
+def _is_plain(value) -> bool:
+    return value is None or isinstance(value, (str, int, float))
+
+
+class ReceiptCache:
+    """
+    Persistent cache of each receipt file's OCR fields and chunk embeddings
+    on SQLite with TTL and LRU eviction, shared by every worker process.
+
+    Entries are keyed by the file's exact content hash and the OCR engine.
+    """
+    def __init__(self, disk_cache: DiskCache):
+        self.disk_cache = disk_cache
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(content_hash: str, engine: str) -> str:
+        return f"sha256:{engine}:{content_hash}"
+
+    def get(self, content_hash: str, engine: str) -> dict:
+        """
+        Returns the cached fields of a receipt, with its embedding matrix under
+        "embedding" when it was made by the current embedding model, or None.
+        """
+        value = self.disk_cache.get(self._key(content_hash, engine))
+        if value is None:
+            self.misses += 1
+            count("cache_lookups", cache="receipt", result="miss")
+            return None
+        self.hits += 1
+        count("cache_lookups", cache="receipt", result="hit")
+
+        entry = json.loads(value)
+        embedding = None
+        if entry["embedding_model"] == Config.AZURE_OPENAI_EMBEDDING_MODEL_NAME:
+            embedding = to_matrix(
+                np.frombuffer(base64.b64decode(entry["embedding"]), dtype=np.float32).reshape(entry["embedding_shape"])
+            )
+        return {**entry["fields"], "embedding": embedding}
+
+    def set(self, content_hash: str, engine: str, fields: dict, embedding: np.ndarray):
+        """
+        Stores a receipt's extracted fields and embedding. Receipts whose
+        fields are not plain strings and numbers (e.g. SDK value types) are
+        not cached, so a hit always returns exactly what OCR produced.
+        """
+        if not all(_is_plain(value) for value in fields.values()):
+            return
+        embedding = to_matrix(embedding)
+        value = json.dumps({
+            "fields": fields,
+            "embedding_model": Config.AZURE_OPENAI_EMBEDDING_MODEL_NAME,
+            "embedding_shape": list(embedding.shape),
+            "embedding": base64.b64encode(embedding.tobytes()).decode("ascii")
+        }).encode("utf-8")
+        self.disk_cache.set(self._key(content_hash, engine), value)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self.disk_cache),
+            "ttl_seconds": self.disk_cache.ttl_seconds
+        }
+
+
+class BatchDuplicates:
+    """
+    Tracks the receipts of one batch so repeats are found.
+
+    Files with the same content hash are processed only once. Images whose
+    perceptual hashes are at most `max_distance` bits apart are only flagged,
+    since different receipts printed from one template can look the same.
+    """
+    def __init__(self, max_distance: int = None):
+        self.max_distance = Config.RECEIPT_PERCEPTUAL_MAX_DISTANCE if max_distance is None else max_distance
+        self._by_content = {}
+        self._by_perceptual = []
+
+    def find(self, content_hash: str):
+        """
+        Returns (filename, future result) of the first receipt with this
+        exact content, or None.
+        """
+        return self._by_content.get(content_hash)
+
+    def find_similar(self, perceptual_hash: int) -> str:
+        """
+        Returns the filename of the first image looking like this one, or None.
+        """
+        if perceptual_hash is not None:
+            for other_hash, filename in self._by_perceptual:
+                if bin(other_hash ^ perceptual_hash).count("1") <= self.max_distance:
+                    return filename
+        return None
+
+    def add(self, filename: str, content_hash: str, perceptual_hash: int) -> asyncio.Future:
+        """
+        Registers a receipt as the original for its hashes. Set the returned
+        future to its result once processed.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._by_content[content_hash] = (filename, future)
+        if perceptual_hash is not None:
+            self._by_perceptual.append((perceptual_hash, filename))
+        return future
+
+
+@lru_cache(maxsize=None)
+def get_receipt_cache() -> ReceiptCache:
+    """
+    Returns the process-wide receipt cache, or None when caching is disabled.
+    """
+    if not Config.RECEIPT_CACHE_ENABLED:
+        return None
+    return ReceiptCache(DiskCache(Config.RECEIPT_CACHE_PATH, Config.RECEIPT_CACHE_MAX_ENTRIES, Config.RECEIPT_CACHE_TTL_SECONDS))
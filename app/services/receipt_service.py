@@ -1,143 +1,327 @@
-from fastapi import UploadFile
-from app.core.azure_service_client import AzureOpenAIClient
-import fitz  # PyMuPDF
-from pdf2image import convert_from_bytes
-import pytesseract
-from PIL import Image, UnidentifiedImageError
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Callable
+from fastapi import UploadFile, HTTPException
+from app.core.azure_service_client import get_azure_openai_client
+from app.core.embedding_batcher import EmbeddingBatcher
+from app.core.metrics import timed
+from app.core.scheduler import get_scheduler
 import io
-from azure.ai.formrecognizer import DocumentAnalysisClient
-from azure.core.credentials import AzureKeyCredential
 from app.core.config.config import Config
 import os
-from app.utils.receipt_extractdata import extract_receipt_id, extract_amount
+from concurrent.futures.process import BrokenProcessPool
+from app.services.local_ocr import discard_local_ocr_pool, extract_receipt_local, get_local_ocr_pool
+from app.services.receipt_cache import BatchDuplicates, get_receipt_cache, receipt_content_hash, receipt_perceptual_hash
+from app.utils.archive import is_archive, iter_archive_members
 
+logger = logging.getLogger(__name__)
 
-form_recognizer_client = DocumentAnalysisClient(
-    endpoint=Config.FORM_RECOGNIZER_ENDPOINT,
-    credential=AzureKeyCredential(Config.FORM_RECOGNIZER_API_KEY)
-)
 
-async def handle_receipt_batch(files: list[UploadFile]):
-    print("Processing batch of receipt files...")
-    azure_client = AzureOpenAIClient()
-    results = []
+@lru_cache(maxsize=None)
+def get_form_recognizer_client():
+    """
+    Returns the process-wide Form Recognizer client, creating it on first use.
+    """
+    Config.require("FORM_RECOGNIZER_ENDPOINT", "FORM_RECOGNIZER_API_KEY")
+    from azure.ai.formrecognizer import DocumentAnalysisClient
+    from azure.core.credentials import AzureKeyCredential
+
+    # Retries are left to the form_recognizer RequestScheduler, which also keeps analyses within FORM_RECOGNIZER_RPM
+    return DocumentAnalysisClient(
+        endpoint=Config.FORM_RECOGNIZER_ENDPOINT,
+        credential=AzureKeyCredential(Config.FORM_RECOGNIZER_API_KEY),
+        retry_total=0
+    )
+
+# Form Recognizer's SDK is synchronous, so analyses run on a dedicated, bounded thread pool
+ocr_executor = ThreadPoolExecutor(max_workers=Config.OCR_MAX_IN_FLIGHT, thread_name_prefix="receipt-ocr")
+
+def analyze_receipt(content: bytes):
+    poller = get_form_recognizer_client().begin_analyze_document(
+        model_id="prebuilt-receipt",  # Use the prebuilt receipt model
+        document=io.BytesIO(content)
+    )
+    return poller.result()
+
+def extract_receipt_fields(document_analysis_result) -> dict:
+    """
+    Extracts the receipt ID, total and field text from a Form Recognizer result.
+
+    The total is returned as a plain number: receipt models from API version
+    2023-07-31 type it as a CurrencyValue, which neither compares with expense
+    amounts nor fits in the receipt cache.
+    """
+    extracted_data = []
+    receipt_id = None
+    amount = None
+    for document in document_analysis_result.documents:
+        for field_name, field in document.fields.items():
+            if field.value:
+                extracted_data.append(f"{field_name}: {field.value} (confidence: {field.confidence})")
+
+        receipt_id_field = document.fields.get("TransactionId")
+        receipt_id = receipt_id_field.value if receipt_id_field and receipt_id_field.value else None
+        amount_field = document.fields.get("Total")
+        amount = amount_field.value if amount_field and amount_field.value else None
+        amount = getattr(amount, "amount", amount)
+
+    return {
+        "receipt_id": receipt_id,
+        "amount": amount,
+        "text": "\n".join(extracted_data)
+    }
+
+async def extract_receipt(content: bytes, filename: str, engine: str) -> dict:
+    """
+    Extracts a receipt's ID, amount and text with the selected OCR engine.
 
-    for file in files:  # Iterate over each UploadFile object in the list
+    Args:
+        content: Raw receipt file bytes.
+        filename: Original receipt filename.
+        engine: "azure" for Form Recognizer, or "local" for PyMuPDF/Tesseract
+            extraction on the local process pool.
+    """
+    loop = asyncio.get_running_loop()
+    if engine == "local":
+        pool = get_local_ocr_pool(Config.LOCAL_OCR_WORKERS)
         try:
+            return await loop.run_in_executor(pool, extract_receipt_local, content, filename)
+        except BrokenProcessPool:
+            # A worker died; replace the pool so later receipts are not failed with it
+            discard_local_ocr_pool(pool)
+            raise RuntimeError("Local OCR worker crashed while reading this receipt.")
+    document_analysis_result = await get_scheduler("form_recognizer").submit(
+        lambda: loop.run_in_executor(ocr_executor, analyze_receipt, content)
+    )
+    return extract_receipt_fields(document_analysis_result)
+
+async def process_receipt(
+    file: UploadFile,
+    ocr_slots: asyncio.Semaphore,
+    embedder: EmbeddingBatcher,
+    engine: str,
+    duplicates: BatchDuplicates = None,
+    on_read: Callable[[], None] = None
+) -> dict:
+    """
+    Runs OCR and embedding for one receipt file.
+
+    The file is read and analyzed while holding an OCR slot. Its chunks are
+    embedded after the slot is released, so embedding overlaps with the
+    analysis of other receipts.
+
+    Receipts found in the receipt cache skip OCR, and embedding too unless the
+    embedding model has changed. An exact repeat of a file earlier in the
+    batch reuses that file's result and names it in "duplicate_of". A
+    near-identical image (perceptual hash) is still processed on its own and
+    only named in "duplicate_of".
+
+    `on_read`, if given, is called once the file's content is no longer needed.
+    """
+    filename = file.filename  # Access the filename attribute
+    receipt_cache = get_receipt_cache()
+    original = None
+    similar_to = None
+    future = None
+    result = None
+    read_done = False
+
+    def finish_reading():
+        nonlocal read_done
+        if on_read is not None and not read_done:
+            read_done = True
+            on_read()
+
+    try:
+        if not filename.endswith((".pdf", ".jpg", ".jpeg", ".png", ".bmp", ".tiff", "jfif")):
+            raise ValueError("Unsupported file format. Please upload PDF or image files.")
+
+        async with ocr_slots:
             content = await file.read()  # Read the content of the file
-            filename = file.filename  # Access the filename attribute
-            print(f"Processing file: {filename}")
-
-            if filename.endswith((".pdf", ".jpg", ".jpeg", ".png", ".bmp", ".tiff", "jfif")):
-                # Use Azure Form Recognizer to extract text and data
-                print("Using Azure Form Recognizer to extract data...")
-                poller = form_recognizer_client.begin_analyze_document(
-                    model_id="prebuilt-receipt",  # Use the prebuilt receipt model
-                    document=io.BytesIO(content)
-                )
-                document_analysis_result = poller.result()
+            content_hash = receipt_content_hash(content)
+            perceptual_hash = None
+            if Config.RECEIPT_PERCEPTUAL_HASH:
+                perceptual_hash = await asyncio.to_thread(receipt_perceptual_hash, content, filename)
+            if duplicates is not None:
+                original = duplicates.find(content_hash)
+                if original is None:
+                    similar_to = duplicates.find_similar(perceptual_hash)
+                    future = duplicates.add(filename, content_hash, perceptual_hash)
+            if original is None:
+                cached = await asyncio.to_thread(receipt_cache.get, content_hash, engine) if receipt_cache is not None else None
+                if cached is None:
+                    logger.debug("Processing file: %s", filename)
+                    with timed("ocr"):
+                        fields = await extract_receipt(content, filename, engine)
+                else:
+                    fields = cached
+        content = None
+        finish_reading()
 
-                # Extract text and key-value pairs from the receipt
-                extracted_data = []
-                for document in document_analysis_result.documents:
-                    for field_name, field in document.fields.items():
-                        print(f"{field_name}: {field.value} (confidence: {field.confidence})")
-                        if field.value:
-                            extracted_data.append(f"{field_name}: {field.value} (confidence: {field.confidence})")
+        # Wait for the original outside the OCR slot, which it may still need
+        if original is not None:
+            original_filename, original_result = original
+            result = {**await asyncio.shield(original_result), "filename": os.path.splitext(filename)[0], "duplicate_of": original_filename}
+            return result
 
-                receipt_id_field = document.fields.get("TransactionId")
-                receipt_id = receipt_id_field.value if receipt_id_field and receipt_id_field.value else None
-                amount_field = document.fields.get("Total")
-                amount = amount_field.value if amount_field and amount_field.value else None
-                print(f"Extracted Receipt_ID: {receipt_id}, Amount: {amount}")
+        amount = fields["amount"]
+        text = fields["text"]
+        logger.debug("Extracted Receipt_ID: %s, Amount: %s", fields["receipt_id"], amount)
+
+        if not text.strip():
+            raise ValueError("No text detected in receipt.")
+        embedding = cached["embedding"] if cached is not None else None
+        if embedding is None:
+            embedding = await embedder.embed(chunk_text(text))
+            if receipt_cache is not None:
+                await asyncio.to_thread(
+                    receipt_cache.set,
+                    content_hash,
+                    engine,
+                    {"receipt_id": fields["receipt_id"], "amount": amount, "text": text},
+                    embedding
+                )
 
-                text = "\n".join(extracted_data)
-                print("Combined Extracted text:\n", text)  # Log first 100 characters
+        result = {
+            "filename": os.path.splitext(filename)[0],
+            "amount": amount if amount else "Not Detected",
+            "text": text.strip(),
+            "embedding": embedding
+        }
+        if cached is not None:
+            result["cached"] = True
+        if similar_to is not None:
+            result["duplicate_of"] = similar_to
+        return result
 
+    except Exception as e:
+        result = {
+            "filename": os.path.splitext(filename)[0],
+            "error": str(e)
+        }
+        return result
+    finally:
+        finish_reading()
+        # Duplicates waiting on this receipt get its result, or are cancelled with it
+        if future is not None and not future.done():
+            if result is not None:
+                future.set_result(result)
             else:
-                raise ValueError("Unsupported file format. Please upload PDF or image files.")
-
-            if not text.strip():
-                raise ValueError("No text detected in receipt.")
-            chunks = chunk_text(text)
-            print(f"Generated {chunks} chunks from extracted text.")
-            print(filename)
-
-            # Generate embedding
-            chunk_embeddings = [azure_client.generate_embedding(chunk) for chunk in chunks]
-            results.append({
-                "filename": os.path.splitext(filename)[0],
-                "amount": amount if amount else "Not Detected",
-                "text": text.strip(),
-                "embedding": chunk_embeddings
-            })
-
-        except Exception as e:
-            results.append({
-                #"filename": filename,
-                "error": str(e)
-            })
+                future.cancel()
+
+async def iter_receipt_uploads(files: list[UploadFile]):
+    """
+    Yields the receipt files of an upload, expanding ZIP and TAR archives.
+
+    Archive members are read one at a time, off the event loop, from the
+    archive's spooled upload file, so an archive is never held in memory whole.
+
+    Yields:
+        (file, is_archive_member, error) triples. Member files live in memory
+        and can be closed once read. An archive member too large to read is
+        yielded empty, with the reason as its error.
+    """
+    for file in files:
+        if not is_archive(file.filename):
+            yield file, False, None
+            continue
+        members = iter_archive_members(
+            file.file,
+            file.filename,
+            Config.RECEIPT_ARCHIVE_MAX_FILES,
+            int(Config.RECEIPT_ARCHIVE_MAX_FILE_MB * 2 ** 20),
+            int(Config.RECEIPT_ARCHIVE_MAX_TOTAL_MB * 2 ** 20)
+        )
+        try:
+            while True:
+                member = await asyncio.to_thread(next, members, None)
+                if member is None:
+                    break
+                member_name, content, error = member
+                yield UploadFile(file=io.BytesIO(content or b""), filename=member_name), True, error
+        finally:
+            members.close()
+
+async def handle_receipt_batch(files: list[UploadFile], engine: str = None, on_receipt_done=None):
+    """
+    Processes a batch of receipt files concurrently.
+
+    At most OCR_MAX_IN_FLIGHT Form Recognizer analyses (or two files per
+    local OCR worker) run at once, and receipt chunks from
+    different files are embedded together in shared requests. Files
+    repeated within the batch are processed once.
+
+    ZIP and TAR archives among the files are expanded member by member. The
+    next receipt is only taken up once fewer than twice the OCR limit are
+    waiting for or in OCR, so a large archive streams through instead of
+    being loaded whole. A member over the per-file size limit gets an error
+    result; an archive over the file-count or total-size limit fails the batch.
+
+    Args:
+        files: Uploaded receipt files and receipt archives.
+        engine: "azure" or "local". Defaults to Config.RECEIPT_OCR_ENGINE.
+        on_receipt_done: Optional callable receiving the number of receipts
+            finished so far, called as each one completes.
+
+    Returns:
+        Dictionary with one result per receipt, in upload and archive order.
+    """
+    logger.info("Processing batch of %d receipt uploads", len(files))
+    engine = engine or Config.RECEIPT_OCR_ENGINE
+    if engine not in ("azure", "local"):
+        raise HTTPException(status_code=400, detail=f"Unknown OCR engine: {engine}. Use 'azure' or 'local'.")
+    # Local OCR is CPU-bound, so keep every pool worker busy with one file queued behind it
+    in_flight = Config.OCR_MAX_IN_FLIGHT if engine == "azure" else 2 * Config.LOCAL_OCR_WORKERS
+    ocr_slots = asyncio.Semaphore(in_flight)
+    # Receipts taken up but not yet through OCR; bounds the file contents held in memory
+    receipt_slots = asyncio.Semaphore(2 * in_flight)
+    embedder = EmbeddingBatcher(get_azure_openai_client())
+    duplicates = BatchDuplicates()
+    results = []
+    tasks = []
+    done = 0
+
+    async def process_and_report(position, file, is_member):
+        def release_file():
+            if is_member:
+                file.file.close()
+            receipt_slots.release()
+
+        results[position] = await process_receipt(file, ocr_slots, embedder, engine, duplicates, release_file)
+        report_done()
+
+    def report_done():
+        nonlocal done
+        done += 1
+        if on_receipt_done is not None:
+            on_receipt_done(done)
+
+    try:
+        async for file, is_member, error in iter_receipt_uploads(files):
+            if error is not None:
+                results.append({"filename": os.path.splitext(file.filename)[0], "error": error})
+                report_done()
+                continue
+            await receipt_slots.acquire()
+            results.append(None)
+            tasks.append(asyncio.ensure_future(process_and_report(len(results) - 1, file, is_member)))
+        await asyncio.gather(*tasks)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Receipt archive error: {str(e)}")
+    finally:
+        for task in tasks:
+            task.cancel()
 
     return {
         "status": "success",
         "receipts_processed": len(results),
         "data": results,
-        "chunk":len(chunks)
+        "duplicates": sum(1 for result in results if "duplicate_of" in result),
+        "chunk": sum(len(result.get("embedding", [])) for result in results)
     }
-# async def handle_receipt_batch(files: list[UploadFile]):
-#     print("Processing batch of receipt files...")
-#     azure_client = AzureOpenAIClient()
-#     results = []
-
-#     for file in files:
-#         try:
-#             content = await file.read()
-#             filename = file.filename.lower()
-#             text = ""
-#             print(f"Processing file: {filename}")
-
-#             if filename.endswith(".pdf"):
-#                 # Try extracting text using PyMuPDF
-#                 doc = fitz.open(stream=content, filetype="pdf")
-#                 text = "\n".join(page.get_text() for page in doc)
-#                 print(f"Extracted text from PDF: {text[:100]}...")  # Log first 100 characters
-
-#                 # If no text found, fall back to OCR
-#                 if not text.strip():
-#                     images = convert_from_bytes(content)
-#                     text = "\n".join(pytesseract.image_to_string(img) for img in images)
-
-#             elif filename.endswith((".jpg", ".jpeg", ".png", ".bmp", ".tiff","jfif")):
-#                 image = Image.open(io.BytesIO(content)).convert("RGB")
-#                 text = pytesseract.image_to_string(image)
-#                 print(f"Extracted text from image: {text[:100]}...")  # Log first 100 characters
-
-#             else:
-#                 raise ValueError("Unsupported file format. Please upload PDF or image files.")
-
-#             if not text.strip():
-#                 raise ValueError("No text detected in receipt.")
-
-#             # Generate embedding
-#             embedding = azure_client.generate_embedding(text)
-
-#             results.append({
-#                 "filename": file.filename,
-#                 "text": text.strip(),
-#                 "embedding": embedding
-#             })
-
-#         except Exception as e:
-#             results.append({
-#                 "filename": file.filename,
-#                 "error": str(e)
-#             })
-
-#     return {
-#         "status": "success",
-#         "receipts_processed": len(results),
-#         "data": results
-#     }
+
 def chunk_text(text: str, chunk_size: int = 500) -> list:
     """
     Splits the input text into smaller chunks of the specified size.
@@ -0,0 +1,99 @@
+import hashlib
+import io
+import os
+import re
+import tempfile
+import time
+import numpy as np
+from app.core.config.config import Config
+from app.utils.vectors import to_matrix
+
+_VECTORS_ID_PATTERN = re.compile(r"[0-9a-f]{64}")
+_last_purge = 0.0
+
+
+def _vectors_path(vectors_id: str) -> str:
+    if not _VECTORS_ID_PATTERN.fullmatch(vectors_id or ""):
+        raise ValueError(f"Invalid vectors ID: {vectors_id}")
+    return os.path.join(Config.VECTOR_STORE_DIR, f"{vectors_id}.npy")
+
+
+def _is_expired(path: str, now: float) -> bool:
+    return Config.VECTOR_STORE_TTL_SECONDS > 0 and now - os.path.getmtime(path) > Config.VECTOR_STORE_TTL_SECONDS
+
+
+def purge_expired_vectors() -> int:
+    """
+    Deletes stored vectors, and temp files left by interrupted saves, that are
+    older than Config.VECTOR_STORE_TTL_SECONDS.
+
+    Returns:
+        The number of files removed.
+    """
+    global _last_purge
+    now = time.time()
+    _last_purge = now
+    if Config.VECTOR_STORE_TTL_SECONDS <= 0 or not os.path.isdir(Config.VECTOR_STORE_DIR):
+        return 0
+    removed = 0
+    for entry in os.scandir(Config.VECTOR_STORE_DIR):
+        if not entry.name.endswith((".npy", ".tmp")):
+            continue
+        try:
+            if _is_expired(entry.path, now):
+                os.remove(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            # Removed by another worker in the meantime
+            pass
+    return removed
+
+
+def save_vectors(matrix) -> str:
+    """
+    Stores a vector matrix on local disk under the hash of its contents.
+
+    Blocks on disk I/O, so async callers run it with asyncio.to_thread. Saving
+    the same matrix again renews its TTL, and expired vectors are swept at most
+    once per Config.VECTOR_STORE_PURGE_INTERVAL_SECONDS.
+
+    Returns:
+        The vectors ID, for retrieval through /ingest/vectors/{vectors_id}.
+    """
+    matrix = to_matrix(matrix)
+    digest = hashlib.sha256(str(matrix.shape).encode("utf-8"))
+    digest.update(matrix.tobytes())
+    vectors_id = digest.hexdigest()
+
+    path = _vectors_path(vectors_id)
+    if not os.path.exists(path):
+        os.makedirs(Config.VECTOR_STORE_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=Config.VECTOR_STORE_DIR, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, matrix)
+        os.replace(tmp_path, path)
+    else:
+        os.utime(path)
+
+    if time.time() - _last_purge > Config.VECTOR_STORE_PURGE_INTERVAL_SECONDS:
+        purge_expired_vectors()
+    return vectors_id
+
+
+def load_vectors(vectors_id: str) -> np.ndarray:
+    """
+    Returns a stored vector matrix, or None if the ID is unknown or expired.
+    """
+    path = _vectors_path(vectors_id)
+    try:
+        if _is_expired(path, time.time()):
+            return None
+        return np.load(path)
+    except FileNotFoundError:
+        return None
+
+
+def vectors_to_npy(matrix) -> bytes:
+    buffer = io.BytesIO()
+    np.save(buffer, to_matrix(matrix))
+    return buffer.getvalue()
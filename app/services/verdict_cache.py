@@ -0,0 +1,86 @@
+import hashlib
+import json
+from functools import lru_cache
+from app.core.config.config import Config
+from app.core.disk_cache import DiskCache
+from app.core.metrics import count
+
+
+def _normalize_amount(amount):
+    try:
+        return round(float(amount), 2)
+    except (TypeError, ValueError):
+        return None
+
+
+def _normalize_category(category):
+    if category is None:
+        return None
+    return " ".join(str(category).split()).casefold()
+
+
+def verdict_cache_key(record_data: dict, policy_chunks: list[str], model: str, prompt_template: str) -> str:
+    """
+    Returns the cache key of an LLM verdict.
+
+    Only the record fields that decide the verdict are hashed, so the same
+    fare or allowance on different records and submissions shares one entry.
+    Receipt IDs and names are left out for the same reason. The policy chunks
+    are the ones retrieved into the prompt, so a changed policy yields new keys.
+    """
+    payload = {
+        "receipt_amount": _normalize_amount(record_data.get("receipt_amount")),
+        "expense_amount": _normalize_amount(record_data.get("expense_amount")),
+        "category": _normalize_category(record_data.get("categories")),
+        "policy_chunks": list(policy_chunks),
+        "model": model,
+        "prompt": hashlib.sha256(prompt_template.encode("utf-8")).hexdigest()
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class VerdictCache:
+    """
+    Persistent LLM verdict cache on SQLite with TTL and LRU eviction, shared by
+    every worker process.
+    """
+    def __init__(self, disk_cache: DiskCache):
+        self.disk_cache = disk_cache
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, keys: list[str]) -> dict:
+        """
+        Returns the cached verdict for each key that has one.
+        """
+        found = {key: value.decode("utf-8") for key, value in self.disk_cache.get_many(list(set(keys))).items()}
+        hits = sum(1 for key in keys if key in found)
+        self.hits += hits
+        self.misses += len(keys) - hits
+        count("cache_lookups", hits, cache="verdict", result="hit")
+        count("cache_lookups", len(keys) - hits, cache="verdict", result="miss")
+        return found
+
+    def set_many(self, verdicts: dict):
+        if verdicts:
+            self.disk_cache.set_many({key: verdict.encode("utf-8") for key, verdict in verdicts.items()})
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self.disk_cache),
+            "ttl_seconds": self.disk_cache.ttl_seconds
+        }
+
+
+@lru_cache(maxsize=None)
+def get_verdict_cache() -> VerdictCache:
+    """
+    Returns the process-wide verdict cache, or None when caching is disabled.
+    """
+    if not Config.VERDICT_CACHE_ENABLED:
+        return None
+    return VerdictCache(DiskCache(Config.VERDICT_CACHE_PATH, Config.VERDICT_CACHE_MAX_ENTRIES, Config.VERDICT_CACHE_TTL_SECONDS))
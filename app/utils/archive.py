@@ -0,0 +1,77 @@
+import os
+import tarfile
+import zipfile
+
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+
+def is_archive(filename: str) -> bool:
+    return (filename or "").lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def _is_metadata(name: str) -> bool:
+    # Folders and OS metadata such as __MACOSX/ and ._ resource forks are not receipts
+    parts = name.replace("\\", "/").split("/")
+    return name.endswith("/") or any(part.startswith(".") or part == "__MACOSX" for part in parts)
+
+
+def iter_archive_members(file, filename: str, max_files: int, max_file_bytes: int, max_total_bytes: int):
+    """
+    Reads the files of a ZIP or TAR archive one at a time, without extracting
+    or loading the whole archive.
+
+    Args:
+        file: Binary file object, e.g. an UploadFile's spooled file. ZIP
+            archives need it to be seekable; TAR archives are read as a stream.
+        filename: Original archive filename, used to detect the archive type.
+        max_files: Maximum number of files read from the archive.
+        max_file_bytes: Maximum uncompressed size of any one file. Larger
+            files are reported and skipped, not read.
+        max_total_bytes: Maximum uncompressed bytes read from the whole archive.
+
+    Yields:
+        (member filename without its folders, member bytes, error) triples, in
+        archive order. For a file over `max_file_bytes` the bytes are None and
+        the error says why; otherwise the error is None.
+
+    Raises:
+        ValueError: If the archive cannot be read, or holds more than
+            `max_files` files or `max_total_bytes` bytes.
+    """
+    file.seek(0)
+    count = 0
+    total_bytes = 0
+
+    def read_limited(member_file, name: str) -> tuple:
+        nonlocal total_bytes
+        content = member_file.read(max_file_bytes + 1)
+        total_bytes += len(content)
+        if total_bytes > max_total_bytes:
+            raise ValueError(f"Archive holds more than {max_total_bytes // 2 ** 20} MB of files.")
+        if len(content) > max_file_bytes:
+            return None, f"{name} is larger than {max_file_bytes // 2 ** 20} MB."
+        return content, None
+
+    try:
+        if filename.lower().endswith(".zip"):
+            with zipfile.ZipFile(file) as archive:
+                for info in archive.infolist():
+                    if info.is_dir() or _is_metadata(info.filename):
+                        continue
+                    count += 1
+                    if count > max_files:
+                        raise ValueError(f"Archive holds more than {max_files} files.")
+                    with archive.open(info) as member_file:
+                        yield os.path.basename(info.filename), *read_limited(member_file, info.filename)
+        else:
+            # Stream mode reads members in order without seeking back
+            with tarfile.open(fileobj=file, mode="r|*") as archive:
+                for member in archive:
+                    if not member.isfile() or _is_metadata(member.name):
+                        continue
+                    count += 1
+                    if count > max_files:
+                        raise ValueError(f"Archive holds more than {max_files} files.")
+                    yield os.path.basename(member.name), *read_limited(archive.extractfile(member), member.name)
+    except (zipfile.BadZipFile, tarfile.TarError, EOFError) as e:
+        raise ValueError(f"Could not read archive {filename}: {str(e)}")
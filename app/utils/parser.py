@@ -1,22 +1,114 @@
 import pandas as pd
-import io
 
-# Function to parse expense file
-def parse_expense_file(file_bytes: bytes, filename: str) -> pd.DataFrame:
+
+# Columns used by expense ingestion, with the dtypes they are parsed as in streaming mode
+EXPENSE_COLUMN_DTYPES = {
+    "ID": "str",
+    "Date": "str",
+    "Category": "str",
+    "Description": "str",
+    "Amount": "float64",
+    "Receipt_Attached": "boolean",
+    "Receipt_ID": "str"
+}
+REQUIRED_EXPENSE_COLUMNS = {"Amount", "Date", "Category", "Description"}
+# Spellings read as True/False in the Receipt_Attached column
+RECEIPT_FLAG_TRUE_VALUES = ["Yes", "yes", "Y"]
+RECEIPT_FLAG_FALSE_VALUES = ["No", "no", "N"]
+
+
+def _validate_expense_header(columns) -> list[str]:
+    missing = REQUIRED_EXPENSE_COLUMNS - set(columns)
+    if missing:
+        raise ValueError(f"Missing required columns: {missing}")
+    # Keep the file's column order, so record texts read the same as the full file
+    return [column for column in columns if column in EXPENSE_COLUMN_DTYPES]
+
+
+def _to_receipt_flag(value):
+    if isinstance(value, str):
+        if value in RECEIPT_FLAG_TRUE_VALUES:
+            return True
+        if value in RECEIPT_FLAG_FALSE_VALUES:
+            return False
+    return value
+
+
+def _apply_expense_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    # Excel cells arrive as Python values; give them the same dtypes the CSV reader does
+    if "Receipt_Attached" in df.columns:
+        df = df.assign(Receipt_Attached=df["Receipt_Attached"].map(_to_receipt_flag))
+    return df.astype({column: EXPENSE_COLUMN_DTYPES[column] for column in df.columns})
+
+
+def _iter_csv_chunks(file, chunk_size: int):
+    header = pd.read_csv(file, nrows=0).columns
+    usecols = _validate_expense_header(header)
+    file.seek(0)
+    yield from pd.read_csv(
+        file,
+        usecols=usecols,
+        dtype={column: EXPENSE_COLUMN_DTYPES[column] for column in usecols},
+        true_values=RECEIPT_FLAG_TRUE_VALUES,
+        false_values=RECEIPT_FLAG_FALSE_VALUES,
+        chunksize=chunk_size
+    )
+
+
+def _iter_xlsx_chunks(file, chunk_size: int):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(value) if value is not None else "" for value in next(rows, ())]
+        usecols = _validate_expense_header(header)
+        positions = [header.index(column) for column in usecols]
+
+        def to_frame(batch):
+            df = pd.DataFrame([[row[p] if p < len(row) else None for p in positions] for row in batch], columns=usecols)
+            return _apply_expense_dtypes(df)
+
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= chunk_size:
+                yield to_frame(batch)
+                batch = []
+        if batch:
+            yield to_frame(batch)
+    finally:
+        workbook.close()
+
+
+def iter_expense_chunks(file, filename: str, chunk_size: int):
+    """
+    Parses an expense file in fixed-size row chunks without loading it whole.
+
+    Only the expense columns are read, with explicit dtypes, and the required
+    columns are validated from the header before any rows are parsed.
+
+    Args:
+        file: Seekable binary file object, e.g. an UploadFile's spooled file.
+        filename: Original filename, used to detect the file type.
+        chunk_size: Maximum rows per chunk.
+
+    Yields:
+        DataFrames of at most `chunk_size` expense records, in file order.
+    """
     try:
         if filename.endswith(".csv"):
-            df = pd.read_csv(io.BytesIO(file_bytes))
-        elif filename.endswith((".xls", ".xlsx")):
-            df = pd.read_excel(io.BytesIO(file_bytes))
+            yield from _iter_csv_chunks(file, chunk_size)
+        elif filename.endswith(".xlsx"):
+            yield from _iter_xlsx_chunks(file, chunk_size)
+        elif filename.endswith(".xls"):
+            # Legacy .xls workbooks cannot be read incrementally
+            df = pd.read_excel(file)
+            usecols = _validate_expense_header(df.columns)
+            df = _apply_expense_dtypes(df[usecols])
+            for start in range(0, len(df), chunk_size):
+                yield df.iloc[start:start + chunk_size]
         else:
             raise ValueError("Unsupported file format. Please upload a CSV or Excel file.")
-        
-        # Optional: validate required columns
-        required_columns = {"Amount", "Date", "Category", "Description"}
-        if not required_columns.issubset(df.columns):
-            raise ValueError(f"Missing required columns: {required_columns - set(df.columns)}")
-
-        return df
     except Exception as e:
         raise ValueError(f"Failed to parse expense file: {str(e)}")
-
@@ -0,0 +1,57 @@
+import numpy as np
+
+
+def to_matrix(vectors) -> np.ndarray:
+    """
+    Returns `vectors` as a contiguous float32 matrix with one row per vector.
+    """
+    matrix = np.ascontiguousarray(vectors, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1) if matrix.size else matrix.reshape(0, 0)
+    return matrix
+
+
+def quantize_int8(matrix: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Quantizes a float matrix to int8 with one symmetric scale per row.
+
+    Returns:
+        The int8 codes and the float32 row scales; codes * scales recovers
+        the matrix to within half a quantization step.
+    """
+    matrix = to_matrix(matrix)
+    scales = np.abs(matrix).max(axis=1, keepdims=True) / 127.0 if matrix.size else np.zeros((len(matrix), 1), np.float32)
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(matrix / scales), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32).ravel()
+
+
+def dequantize_int8(codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    return codes.astype(np.float32) * np.asarray(scales, dtype=np.float32).reshape(-1, 1)
+
+
+# Values accepted for `quantize`, besides None for plain floats
+QUANTIZE_FORMATS = ("int8",)
+
+
+def check_quantize(quantize: str = None):
+    if quantize is not None and quantize not in QUANTIZE_FORMATS:
+        raise ValueError(f"Unsupported quantize value: {quantize}. Use one of {', '.join(QUANTIZE_FORMATS)}.")
+
+
+def vectors_to_json(matrix: np.ndarray, quantize: str = None):
+    """
+    Converts a vector matrix to JSON-serializable lists at the API boundary.
+
+    Args:
+        matrix: Vector matrix (one row per vector).
+        quantize: "int8" to return int8 codes with per-row scales instead of floats.
+
+    Raises:
+        ValueError: If `quantize` is not None or one of QUANTIZE_FORMATS.
+    """
+    check_quantize(quantize)
+    if quantize == "int8":
+        codes, scales = quantize_int8(matrix)
+        return {"dtype": "int8", "codes": codes.tolist(), "scales": scales.tolist()}
+    return to_matrix(matrix).tolist()
@@ -0,0 +1,301 @@
+"""
+Local stand-ins for the Azure services, with configurable latency and throttling.
+
+  * A fake Azure OpenAI server for embeddings and chat completions. Point
+    AZURE_OPENAI_ENDPOINT at it and the real SDK, connection pool and request
+    scheduler are exercised end to end, including 429 + retry-after-ms.
+  * FakeFormRecognizerClient, injected in place of the Form Recognizer client,
+    reads the receipt fields from the JSON receipts made by synthetic.py.
+  * FakeEncoding, swapped in for tiktoken's cl100k_base by
+    use_offline_tokenizer when the encoding cannot be downloaded.
+
+Run the server on its own with:
+
+    python benchmarks/fake_azure.py --port 8765 --chat-latency-ms 300 --rpm 600
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+import numpy as np
+
+
+class _Bucket:
+    """
+    Requests-per-minute limiter returning how long a rejected caller should wait.
+    """
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60
+        self.available = self.rate  # One second of burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self) -> float:
+        if self.rate <= 0:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            self.available = min(self.rate, self.available + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.available >= 1:
+                self.available -= 1
+                return 0.0
+            return (1 - self.available) / self.rate
+
+
+def fake_embedding(text: str, dim: int) -> np.ndarray:
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def fake_verdict(record: dict) -> str:
+    digest = hashlib.sha256(json.dumps(record, sort_keys=True, default=str).encode("utf-8")).digest()
+    if digest[0] < 40:
+        return "Non-compliant: The expense exceeds the limit in the applicable policy."
+    return "Compliant"
+
+
+def create_app(embedding_latency: float, chat_latency: float, rpm: float, dim: int, error_rate: float):
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse
+
+    app = FastAPI()
+    buckets = {"embeddings": _Bucket(rpm), "chat": _Bucket(rpm)}
+    stats = {"embeddings": 0, "chat": 0, "throttled": 0, "errors": 0}
+    rng = np.random.default_rng(0)
+
+    def reject(kind: str):
+        wait = buckets[kind].take()
+        if wait > 0:
+            stats["throttled"] += 1
+            return JSONResponse(
+                {"error": {"code": "429", "message": "Rate limit exceeded."}},
+                status_code=429,
+                headers={"retry-after-ms": str(int(wait * 1000) + 1), "retry-after": str(int(wait) + 1)}
+            )
+        if error_rate and rng.random() < error_rate:
+            stats["errors"] += 1
+            return JSONResponse({"error": {"code": "500", "message": "Internal server error."}}, status_code=500)
+        return None
+
+    @app.post("/openai/deployments/{deployment}/embeddings")
+    async def embeddings(deployment: str, request: Request):
+        body = await request.json()
+        rejected = reject("embeddings")
+        if rejected:
+            return rejected
+        stats["embeddings"] += 1
+        await asyncio.sleep(embedding_latency)
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        data = []
+        for i, text in enumerate(texts):
+            vector = fake_embedding(str(text), dim)
+            embedding = base64.b64encode(vector.tobytes()).decode() if body.get("encoding_format") == "base64" else vector.tolist()
+            data.append({"object": "embedding", "index": i, "embedding": embedding})
+        tokens = sum(len(str(text)) // 4 + 1 for text in texts)
+        return {"object": "list", "data": data, "model": deployment, "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+    @app.post("/openai/deployments/{deployment}/chat/completions")
+    async def chat(deployment: str, request: Request):
+        body = await request.json()
+        rejected = reject("chat")
+        if rejected:
+            return rejected
+        stats["chat"] += 1
+        await asyncio.sleep(chat_latency)
+        prompt = body["messages"][-1]["content"]
+        if (body.get("response_format") or {}).get("type") == "json_object":
+            records = json.loads(prompt.split("Expense Records:\n", 1)[1])
+            content = json.dumps({str(record["receipt_id"]): fake_verdict(record) for record in records})
+        else:
+            content = fake_verdict({"prompt": prompt})
+        prompt_tokens, completion_tokens = len(prompt) // 4 + 1, len(content) // 4 + 1
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": deployment,
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+        }
+
+    @app.get("/_stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_fake_openai_server(
+    embedding_latency_ms: float = 50,
+    chat_latency_ms: float = 300,
+    rpm: float = 0,
+    dim: int = 1536,
+    error_rate: float = 0.0,
+    port: int = None
+) -> tuple:
+    """
+    Starts the fake Azure OpenAI server in a subprocess, so it does not count
+    towards the benchmark's CPU time or RSS.
+
+    Returns:
+        (process, endpoint URL). Terminate the process when done.
+    """
+    port = port or _free_port()
+    process = subprocess.Popen(
+        [
+            sys.executable, os.path.abspath(__file__), "--port", str(port),
+            "--embedding-latency-ms", str(embedding_latency_ms), "--chat-latency-ms", str(chat_latency_ms),
+            "--rpm", str(rpm), "--dim", str(dim), "--error-rate", str(error_rate)
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    endpoint = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            with urllib.request.urlopen(f"{endpoint}/_stats", timeout=1):
+                return process, endpoint
+        except OSError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.terminate()
+                raise RuntimeError("Fake Azure OpenAI server did not start")
+            time.sleep(0.05)
+
+
+def fake_openai_stats(endpoint: str) -> dict:
+    with urllib.request.urlopen(f"{endpoint}/_stats", timeout=5) as response:
+        return json.loads(response.read())
+
+
+class _FakeResponse:
+    def __init__(self, status_code: int, headers: dict):
+        self.status_code = status_code
+        self.reason = "Too Many Requests"
+        self.headers = headers
+
+    def text(self, encoding=None):
+        return ""
+
+
+class _FakePoller:
+    def __init__(self, result, latency: float):
+        self._result = result
+        self._latency = latency
+
+    def result(self):
+        time.sleep(self._latency)
+        return self._result
+
+
+def _document_field(name: str, value):
+    # The prebuilt receipt model (API 2023-07-31, the SDK default) types Total as a currency
+    from azure.ai.formrecognizer import CurrencyValue, DocumentField
+
+    if name == "Total" and isinstance(value, (int, float)):
+        return DocumentField(value_type="currency", value=CurrencyValue(amount=float(value), symbol="$", code="USD"), confidence=0.99)
+    return DocumentField(value_type="float" if isinstance(value, float) else "string", value=value, confidence=0.99)
+
+
+class FakeFormRecognizerClient:
+    """
+    Stand-in for DocumentAnalysisClient with the same begin_analyze_document /
+    poller.result() shape, returning the SDK's own result and field types.
+    Analyses block their thread for `latency_ms`, and calls beyond `rpm`
+    raise a 429 HttpResponseError with Retry-After.
+    """
+    def __init__(self, latency_ms: float = 800, rpm: float = 0):
+        self.latency = latency_ms / 1000
+        self.bucket = _Bucket(rpm)
+        self.calls = 0
+        self.throttled = 0
+
+    def begin_analyze_document(self, model_id: str, document):
+        from azure.ai.formrecognizer import AnalyzedDocument, AnalyzeResult
+        from azure.core.exceptions import HttpResponseError
+
+        wait = self.bucket.take()
+        if wait > 0:
+            self.throttled += 1
+            raise HttpResponseError(message="Rate limit exceeded.", response=_FakeResponse(429, {"retry-after": str(max(1, round(wait)))}))
+        self.calls += 1
+        fields = json.loads(document.read())
+        result = AnalyzeResult(documents=[AnalyzedDocument(
+            doc_type="receipt.retailMeal",
+            fields={name: _document_field(name, value) for name, value in fields.items()}
+        )])
+        return _FakePoller(result, self.latency)
+
+
+class FakeEncoding:
+    """
+    Offline stand-in for a tiktoken encoding: one token per four bytes of
+    UTF-8, close to cl100k_base on English text. The app only counts tokens,
+    to size policy chunks and LLM batches, so the counts move those boundaries
+    slightly but need no real token IDs.
+    """
+    name = "fake_cl100k_base"
+
+    def encode(self, text: str, **kwargs) -> list[int]:
+        return list(range((len(text.encode("utf-8")) + 3) // 4))
+
+
+def use_offline_tokenizer(force: bool = False) -> str:
+    """
+    Makes tiktoken work without network access.
+
+    tiktoken downloads cl100k_base on first use and caches it in
+    TIKTOKEN_CACHE_DIR. If it cannot be loaded (or `force` is set),
+    tiktoken.get_encoding and encoding_for_model are patched to return
+    FakeEncoding for the rest of the process.
+
+    Returns:
+        "tiktoken" if the real encoding loaded, otherwise "fake".
+    """
+    import tiktoken
+
+    if not force:
+        try:
+            tiktoken.get_encoding("cl100k_base")
+            return "tiktoken"
+        except Exception:
+            pass
+    tiktoken.get_encoding = lambda encoding_name: FakeEncoding()
+    tiktoken.encoding_for_model = lambda model_name: FakeEncoding()
+    return "fake"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Azure OpenAI server for offline benchmarks")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--embedding-latency-ms", type=float, default=50)
+    parser.add_argument("--chat-latency-ms", type=float, default=300)
+    parser.add_argument("--rpm", type=float, default=0, help="Requests per minute per deployment before 429s (0 = unlimited)")
+    parser.add_argument("--dim", type=int, default=1536, help="Embedding dimensions")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests failing with 500")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    uvicorn.run(
+        create_app(args.embedding_latency_ms / 1000, args.chat_latency_ms / 1000, args.rpm, args.dim, args.error_rate),
+        host="127.0.0.1",
+        port=args.port,
+        log_level="warning"
+    )
@@ -0,0 +1,293 @@
+"""
+Offline throughput benchmark of the ingestion and compliance hot paths.
+
+Azure OpenAI is replaced by the fake server in fake_azure.py, reached through
+the real SDK, and Form Recognizer by FakeFormRecognizerClient. Inputs come from
+synthetic.py. No credentials are needed. Token counting uses tiktoken's
+cl100k_base encoding, which tiktoken downloads once and caches in
+TIKTOKEN_CACHE_DIR. Without network access and a cached copy (or with
+--fake-tokenizer) an approximate offline tokenizer is used instead, and the
+results record which one ran.
+
+Stages, each run --repeat times per scale:
+
+  expense     handle_expense_upload on the synthetic expense CSV
+  policy      handle_policy_upload on a fresh synthetic policy DOCX
+  receipts    handle_receipt_batch on the synthetic receipts
+  compliance  check_compliance over the outputs of the three stages above
+  pipeline    run_compliance_pipeline end to end, with the policy already stored
+
+For every stage it reports records per second, p50/p95 stage time and p50/p95
+item latency, the time from stage start until each receipt or verdict was
+ready (the whole upload for expense and policy). It also reports peak RSS.
+Run from the repository root:
+
+    python benchmarks/pipeline_benchmark.py --scale small medium --output bench.json
+
+The embedding, verdict and receipt caches are off unless --with-caches is
+given, so repeats measure the uncached path. With --receipt-archive the
+receipts are uploaded as one ZIP archive instead of one file each.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import synthetic
+from fake_azure import start_fake_openai_server, fake_openai_stats, use_offline_tokenizer, FakeFormRecognizerClient
+
+STAGES = ["expense", "policy", "receipts", "compliance", "pipeline"]
+
+
+class PeakRSS:
+    """
+    Samples the process RSS in a background thread while a stage runs.
+    Falls back to the lifetime peak from getrusage where /proc is unavailable.
+    """
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def current() -> int:
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError):
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.current())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = self.current()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current())
+
+
+def _percentiles(samples: list[float]) -> dict:
+    if not samples:
+        return {"p50": None, "p95": None}
+    return {
+        "p50": round(float(np.percentile(samples, 50)), 4),
+        "p95": round(float(np.percentile(samples, 95)), 4)
+    }
+
+
+def _upload(filename: str, content: bytes):
+    from fastapi import UploadFile
+
+    return UploadFile(file=io.BytesIO(content), filename=filename)
+
+
+async def _run_stage(name: str, repeat: int, run) -> dict:
+    """
+    Runs `run(mark)` `repeat` times. `run` returns the number of records it
+    processed and calls mark() as each item completes.
+    """
+    stage_times, item_latencies, peaks, records = [], [], [], 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        mark = lambda: item_latencies.append(time.perf_counter() - start)
+        with PeakRSS() as rss:
+            records = await run(mark)
+        stage_times.append(time.perf_counter() - start)
+        peaks.append(rss.peak)
+    median = float(np.median(stage_times))
+    result = {
+        "records": records,
+        "records_per_second": round(records / median, 2) if median else None,
+        "stage_seconds": _percentiles(stage_times),
+        "item_latency_seconds": _percentiles(item_latencies),
+        "peak_rss_mb": round(max(peaks) / 2 ** 20, 1)
+    }
+    print(
+        f"  {name:<11} {result['records']:>7} rec  {result['records_per_second'] or 0:>10.1f} rec/s  "
+        f"stage p50 {result['stage_seconds']['p50']:.3f}s p95 {result['stage_seconds']['p95']:.3f}s  "
+        f"item p50 {result['item_latency_seconds']['p50'] or 0:.3f}s p95 {result['item_latency_seconds']['p95'] or 0:.3f}s  "
+        f"peak RSS {result['peak_rss_mb']} MB"
+    )
+    return result
+
+
+async def benchmark_scale(scale_name: str, args) -> dict:
+    from app.services.ingestion_service import handle_expense_upload
+    from app.services.policy_ingestion import handle_policy_upload
+    from app.services.receipt_service import handle_receipt_batch
+    from app.services.compliance_check import iter_compliance
+    from app.services.compliance_pipeline import iter_compliance_pipeline
+
+    scale = synthetic.SCALES[scale_name]
+    csv_bytes = synthetic.expense_csv(scale.records, scale.receipts, seed=args.seed)
+    receipts = synthetic.receipt_files(csv_bytes, scale.receipts)
+    if args.receipt_archive:
+        receipts = [("receipts.zip", synthetic.receipt_archive(receipts))]
+    policy_runs = iter(range(args.seed, args.seed + 10 ** 6))
+    outputs = {}
+    results = {}
+    print(f"scale {scale_name}: {scale.records} records, {scale.receipts} receipts, {scale.policy_sections} policy sections")
+
+    async def expense(mark):
+        outputs["expense"] = await handle_expense_upload(_upload("expenses.csv", csv_bytes))
+        mark()
+        return outputs["expense"]["record_count"]
+
+    async def policy(mark):
+        # A new document and filename each run, so neither the policy store nor
+        # incremental re-ingestion of an earlier version short-circuits it
+        run = next(policy_runs)
+        docx_bytes = synthetic.policy_docx(scale.policy_sections, seed=run)
+        outputs["policy"] = await handle_policy_upload(_upload(f"policy-{run}.docx", docx_bytes))
+        outputs["policy_filename"] = f"policy-{run}.docx"
+        outputs["policy_bytes"] = docx_bytes
+        mark()
+        return outputs["policy"]["chunk_count"]
+
+    async def receipt_batch(mark):
+        outputs["receipts"] = await handle_receipt_batch(
+            [_upload(filename, content) for filename, content in receipts],
+            on_receipt_done=lambda done: mark()
+        )
+        return outputs["receipts"]["receipts_processed"]
+
+    async def compliance(mark):
+        expense_data, policy_data = outputs["expense"], outputs["policy"]
+        receipt_data = outputs["receipts"]["data"]
+        records = 0
+        async for _ in iter_compliance(
+            expense_vectors=expense_data["record_vectors"],
+            receipt_vectors=[r.get("embedding") for r in receipt_data],
+            policy_vectors=policy_data["chunk_vectors"],
+            record_ids=expense_data["record_ids"],
+            receipt_flags=expense_data["receipt_flags"],
+            receipt_ids=expense_data["receipt_ids"],
+            receipt_names=[r["filename"] for r in receipt_data],
+            expense_amounts=expense_data["receipt_amounts"],
+            receipt_amounts=[r.get("amount") for r in receipt_data],
+            policy_chunks=policy_data["chunks"],
+            categories=expense_data["categories"],
+            judge_mode=args.judge_mode,
+            policy_rules=policy_data.get("rules"),
+            receipt_errors=[r.get("error") for r in receipt_data]
+        ):
+            records += 1
+            mark()
+        return records
+
+    async def pipeline(mark):
+        records = 0
+        async for _ in iter_compliance_pipeline(
+            _upload("expenses.csv", csv_bytes),
+            [_upload(filename, content) for filename, content in receipts],
+            policy_file=_upload(outputs["policy_filename"], outputs["policy_bytes"])
+        ):
+            records += 1
+            mark()
+        return records
+
+    stages = {"expense": expense, "policy": policy, "receipts": receipt_batch, "compliance": compliance, "pipeline": pipeline}
+    # compliance and pipeline need the outputs of the ingestion stages
+    needed = set(args.stages)
+    if needed & {"compliance", "pipeline"}:
+        needed |= {"expense", "policy", "receipts"}
+    for name in STAGES:
+        if name in needed:
+            results[name] = await _run_stage(name, args.repeat if name in args.stages else 1, stages[name])
+    return {name: result for name, result in results.items() if name in args.stages}
+
+
+async def run(args, endpoint: str) -> dict:
+    import app.services.receipt_service as receipt_service
+    from app.core.scheduler import get_scheduler
+
+    # Inject the fake in place of the lazily built Form Recognizer client
+    fake_form_recognizer = FakeFormRecognizerClient(args.ocr_latency_ms, args.ocr_rpm)
+    receipt_service.get_form_recognizer_client = lambda: fake_form_recognizer
+
+    results = {"scales": {}}
+    for scale_name in args.scale:
+        results["scales"][scale_name] = await benchmark_scale(scale_name, args)
+    results["schedulers"] = {service: get_scheduler(service).stats() for service in ("chat", "embeddings", "form_recognizer")}
+    results["fake_openai"] = fake_openai_stats(endpoint)
+    results["fake_form_recognizer"] = {"calls": fake_form_recognizer.calls, "throttled": fake_form_recognizer.throttled}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", nargs="+", choices=list(synthetic.SCALES), default=["small"])
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per stage")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--embedding-latency-ms", type=float, default=50)
+    parser.add_argument("--chat-latency-ms", type=float, default=300)
+    parser.add_argument("--ocr-latency-ms", type=float, default=800)
+    parser.add_argument("--rpm", type=float, default=0, help="Fake Azure OpenAI requests per minute per deployment (0 = unlimited)")
+    parser.add_argument("--ocr-rpm", type=float, default=0, help="Fake Form Recognizer analyses per minute (0 = unlimited)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of fake Azure OpenAI requests failing with 500")
+    parser.add_argument("--dim", type=int, default=1536, help="Embedding dimensions")
+    parser.add_argument("--judge-mode", choices=["single", "batch"], default=None)
+    parser.add_argument("--with-caches", action="store_true", help="Leave the embedding, verdict and receipt caches on")
+    parser.add_argument("--receipt-archive", action="store_true", help="Upload the receipts as one ZIP archive")
+    parser.add_argument("--fake-tokenizer", action="store_true", help="Count tokens with the offline approximation even if cl100k_base is available")
+    parser.add_argument("--output", help="Write the results as JSON to this path")
+    args = parser.parse_args()
+
+    server, endpoint = start_fake_openai_server(args.embedding_latency_ms, args.chat_latency_ms, args.rpm, args.dim, args.error_rate)
+    storage = tempfile.TemporaryDirectory(prefix="expense-bench-")
+    try:
+        # Config reads the environment at import, so everything is set before the app loads
+        os.environ.update({
+            "AZURE_OPENAI_ENDPOINT": endpoint,
+            "AZURE_OPENAI_API_KEY": "fake-key",
+            "AZURE_OPENAI_API_VERSION": "2024-06-01",
+            "AZURE_OPENAI_EMBEDDING_MODEL_NAME": "fake-embedding",
+            "AZURE_OPENAI_DEPLOYMENT_NAME": "fake-chat",
+            "FORM_RECOGNIZER_ENDPOINT": "http://127.0.0.1:9",
+            "FORM_RECOGNIZER_API_KEY": "fake-key",
+            "STORAGE_DIR": storage.name
+        })
+        if not args.with_caches:
+            os.environ.update({"EMBEDDING_CACHE_ENABLED": "false", "VERDICT_CACHE_ENABLED": "false", "RECEIPT_CACHE_ENABLED": "false"})
+
+        tokenizer = use_offline_tokenizer(force=args.fake_tokenizer)
+        if tokenizer == "fake":
+            print("cl100k_base unavailable or --fake-tokenizer given: counting tokens with the offline approximation")
+
+        results = asyncio.run(run(args, endpoint))
+        results["tokenizer"] = tokenizer
+        results["settings"] = {key: value for key, value in vars(args).items() if key != "output"}
+        print(f"schedulers: {results['schedulers']}")
+        print(f"fake services: openai {results['fake_openai']}, form recognizer {results['fake_form_recognizer']}")
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+    finally:
+        server.terminate()
+        server.wait()
+        storage.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Startup benchmark: how long a fresh worker takes to import the app and to
+start serving.
+
+Each measurement runs in a new interpreter, so nothing is shared between runs:
+
+  import      `import main` wall time
+  cold start  launch of `uvicorn main:app` until GET /openapi.json returns 200
+  modules     slowest imports under main, from `python -X importtime`
+
+Run from the repository root:
+
+    python benchmarks/startup_benchmark.py --runs 5 --output startup.json
+
+Compare the --output files across commits to track startup regressions.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+
+def _summary(samples: list[float]) -> dict:
+    return {
+        "median": round(statistics.median(samples), 3),
+        "min": round(min(samples), 3),
+        "max": round(max(samples), 3),
+        "runs": len(samples)
+    }
+
+
+def measure_import(runs: int) -> dict:
+    code = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", code], cwd=REPO_ROOT, capture_output=True, text=True, check=True)
+        samples.append(float(out.stdout.strip().splitlines()[-1]))
+    return _summary(samples)
+
+
+def slowest_imports(top: int) -> list[dict]:
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=REPO_ROOT, capture_output=True, text=True, check=True)
+    modules = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Only top-level imports of third-party packages and app modules, not their internals
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth <= 2:
+            modules.append({"module": name.strip(), "seconds": int(cumulative) / 1e6})
+    modules.sort(key=lambda m: m["seconds"], reverse=True)
+    return modules[:top]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_cold_start(runs: int, timeout: float) -> dict:
+    samples = []
+    for _ in range(runs):
+        port = _free_port()
+        start = time.perf_counter()
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+            cwd=REPO_ROOT,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        try:
+            while True:
+                if time.perf_counter() - start > timeout:
+                    raise TimeoutError(f"Server did not start within {timeout}s")
+                try:
+                    with urllib.request.urlopen(f"http://127.0.0.1:{port}/openapi.json", timeout=1) as response:
+                        if response.status == 200:
+                            break
+                except OSError:
+                    time.sleep(0.02)
+            samples.append(time.perf_counter() - start)
+        finally:
+            server.terminate()
+            server.wait()
+    return _summary(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Fresh processes per measurement")
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports to list")
+    parser.add_argument("--timeout", type=float, default=60, help="Seconds to wait for the server to come up")
+    parser.add_argument("--output", help="Write the results as JSON to this path")
+    args = parser.parse_args()
+
+    results = {
+        "python": sys.version.split()[0],
+        "import_seconds": measure_import(args.runs),
+        "cold_start_seconds": measure_cold_start(args.runs, args.timeout),
+        "slowest_imports": slowest_imports(args.top)
+    }
+
+    print(f"import main:  median {results['import_seconds']['median']}s (min {results['import_seconds']['min']}s)")
+    print(f"cold start:   median {results['cold_start_seconds']['median']}s (min {results['cold_start_seconds']['min']}s)")
+    print("slowest imports:")
+    for module in results["slowest_imports"]:
+        print(f"  {module['seconds']:8.3f}s  {module['module']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    os.environ.setdefault("PYTHONDONTWRITEBYTECODE", "1")
+    main()
@@ -0,0 +1,125 @@
+"""
+Synthetic expense files, policy documents and receipts for the offline
+benchmarks. Everything is generated from a seed, so runs are comparable.
+"""
+import io
+import json
+import random
+from dataclasses import dataclass
+
+# (category, cap, per-day cap) used in both the policy text and the expense amounts
+CATEGORIES = [
+    ("Meals", 50, True),
+    ("Taxi", 40, False),
+    ("Hotel", 200, True),
+    ("Office Supplies", 100, False),
+    ("Training", 500, False),
+    ("Software", None, False),
+    ("Client Entertainment", None, False)
+]
+
+FILLER = [
+    "Employees must act in the best interests of the company when incurring business expenses.",
+    "Expenses must be submitted within thirty days of being incurred.",
+    "Managers are responsible for reviewing the expenses of their direct reports.",
+    "Personal expenses are not reimbursable under any circumstances.",
+    "Travel should be booked through the approved corporate travel portal.",
+    "Exceptions to this policy require written approval from the finance department."
+]
+
+
+@dataclass
+class Scale:
+    records: int
+    receipts: int
+    policy_sections: int
+
+
+SCALES = {
+    "small": Scale(records=200, receipts=50, policy_sections=10),
+    "medium": Scale(records=2000, receipts=300, policy_sections=40),
+    "large": Scale(records=20000, receipts=2000, policy_sections=150)
+}
+
+
+def expense_csv(records: int, receipts: int, seed: int = 0) -> bytes:
+    """
+    Builds an expense CSV with `records` rows. The first `receipts` rows have a
+    receipt attached (receipt IDs R0..R{receipts-1}); amounts cluster around
+    the category caps so records land on both sides of them.
+    """
+    rng = random.Random(seed)
+    out = io.StringIO()
+    out.write("ID,Amount,Date,Category,Description,Receipt_Attached,Receipt_ID\n")
+    for i in range(records):
+        category, cap, _ = rng.choice(CATEGORIES)
+        amount = round(rng.uniform(0.1, 1.6) * (cap or 120), 2)
+        out.write(
+            f"EXP{i:06d},{amount:.2f},2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d},"
+            f"{category},{category} expense for project {rng.randint(1, 50)},{i < receipts},R{i}\n"
+        )
+    return out.getvalue().encode("utf-8")
+
+
+def expense_amounts(csv_bytes: bytes) -> dict:
+    """
+    Maps receipt ID to amount for the rows of an expense CSV.
+    """
+    amounts = {}
+    for line in csv_bytes.decode("utf-8").splitlines()[1:]:
+        fields = line.split(",")
+        amounts[fields[6]] = float(fields[1])
+    return amounts
+
+
+def policy_text(sections: int, seed: int = 0) -> str:
+    """
+    Builds a policy with one cap sentence per capped category followed by
+    `sections` paragraphs of filler policy text.
+    """
+    rng = random.Random(seed)
+    lines = ["Expense Policy", ""]
+    for category, cap, per_day in CATEGORIES:
+        if cap is not None:
+            lines.append(f"{category}: up to ${cap}{' per day' if per_day else ''}.")
+            lines.append("")
+    for n in range(sections):
+        lines.append(f"Section {n + 1}. " + " ".join(rng.choice(FILLER) for _ in range(4)))
+        lines.append("")
+    return "\n".join(lines)
+
+
+def policy_docx(sections: int, seed: int = 0) -> bytes:
+    import docx
+
+    document = docx.Document()
+    for paragraph in policy_text(sections, seed).split("\n"):
+        document.add_paragraph(paragraph)
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def receipt_files(csv_bytes: bytes, receipts: int) -> list[tuple[str, bytes]]:
+    """
+    Builds (filename, content) pairs for receipts R0..R{receipts-1}. The
+    content is what the fake Form Recognizer client reads its fields from.
+    """
+    amounts = expense_amounts(csv_bytes)
+    return [
+        (f"R{i}.pdf", json.dumps({"TransactionId": f"R{i}", "Total": amounts[f"R{i}"], "MerchantName": f"Vendor {i % 97}"}).encode("utf-8"))
+        for i in range(receipts)
+    ]
+
+
+def receipt_archive(receipts: list[tuple[str, bytes]]) -> bytes:
+    """
+    Packs (filename, content) receipts into one ZIP archive.
+    """
+    import zipfile
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for filename, content in receipts:
+            archive.writestr(f"receipts/{filename}", content)
+    return buffer.getvalue()
@@ -1,14 +1,37 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
 from starlette.middleware.cors import CORSMiddleware
 import uvicorn
 
 # ✅ Grouped Routers
 from app.routers.ingestion import router as ingestion_router
 from app.routers.compliance import router as compliance_router
+from app.services.job_queue import start_job_workers, stop_job_workers
+from app.services.local_ocr import shutdown_local_ocr_pool
+from app.core.config.config import Config
+from app.core.preload import preload_dependencies
+from app.core.metrics import track_request, render_prometheus
+
+# ⚙️ Background compliance job workers run for the lifetime of the app; the local OCR
+# process pool is shut down with them.
+# Heavy libraries and service clients load on first use; preloading warms them in a
+# background thread so the app accepts requests without waiting for them.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+   await start_job_workers()
+   if Config.PRELOAD_ON_STARTUP:
+      app.state.preload = asyncio.create_task(asyncio.to_thread(preload_dependencies))
+   yield
+   await stop_job_workers()
+   await asyncio.to_thread(shutdown_local_ocr_pool)
+
 app = FastAPI(
    title="ExpensePolicy Auditor",
    description="A GenAI system for receipt validation and policy compliance.",
-   version="1.0.0"
+   version="1.0.0",
+   lifespan=lifespan
 )
 
 import logging
@@ -31,6 +54,21 @@ app.add_middleware(
    allow_methods=["*"],
    allow_headers=["*"],
 )
+# ⏱️ Per-request stage timings and Azure call counts, returned as Server-Timing
+@app.middleware("http")
+async def request_metrics_middleware(request: Request, call_next):
+   with track_request() as request_metrics:
+      response = await call_next(request)
+      server_timing = request_metrics.server_timing()
+      if server_timing:
+         response.headers["Server-Timing"] = server_timing
+   return response
+
+# 📈 Prometheus scrape endpoint; each worker process reports its own counters
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+   return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
 # ✅ Register Route Groups
 app.include_router(ingestion_router, prefix="/ingest", tags=["Ingestion"])
 app.include_router(compliance_router, prefix="/compliance", tags=["Compliance Check"])
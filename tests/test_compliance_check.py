@@ -0,0 +1,36 @@
+import asyncio
+from app.services.compliance_check import check_compliance, retrieve_policy_chunks
+
+POLICY_CHUNKS = ["Meals: up to $50 per day.", "Taxi fares are reimbursed up to $40 per ride."]
+POLICY_VECTORS = [[1.0, 0.0], [0.0, 1.0]]
+
+
+def test_records_below_the_threshold_keep_their_best_chunk():
+    record_vectors = [[0.9, 0.1], [0.6, 0.8], [0.1, 0.9]]
+    chunks = retrieve_policy_chunks(record_vectors, POLICY_VECTORS, POLICY_CHUNKS, threshold=0.99)
+
+    assert chunks == [[POLICY_CHUNKS[0]], [POLICY_CHUNKS[1]], [POLICY_CHUNKS[1]]]
+
+
+def test_receipts_that_failed_ocr_are_reported_with_their_error():
+    report = asyncio.run(check_compliance(
+        expense_vectors=[[1.0, 0.0]],
+        receipt_vectors=[None],
+        policy_vectors=POLICY_VECTORS,
+        record_ids=["E1"],
+        receipt_flags=[True],
+        receipt_ids=["R1"],
+        receipt_names=["R1"],
+        expense_amounts=[12.5],
+        receipt_amounts=[None],
+        policy_chunks=POLICY_CHUNKS,
+        categories=["Meals"],
+        receipt_errors=["No text detected in receipt."]
+    ))
+
+    assert report == [{
+        "Record_ID": "E1",
+        "Receipt_ID": "R1",
+        "Compliance": "Non-compliant",
+        "Explanation": "Receipt for Receipt ID R1 could not be read: No text detected in receipt."
+    }]
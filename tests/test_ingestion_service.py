@@ -0,0 +1,17 @@
+import io
+from app.services.ingestion_service import build_record_texts
+from app.utils.parser import iter_expense_chunks
+
+CSV = b"""ID,Date,Category,Description,Amount,Receipt_Attached,Receipt_ID
+E1,2024-01-01,Meals,Lunch,12.5,Yes,R1
+E2,2024-01-02,,Taxi,30,,
+"""
+
+
+def test_missing_values_are_written_as_nan():
+    df = next(iter_expense_chunks(io.BytesIO(CSV), "expenses.csv", 10))
+
+    assert build_record_texts(df) == [
+        "E1 2024-01-01 Meals Lunch 12.5 True R1",
+        "E2 2024-01-02 nan Taxi 30.0 nan nan"
+    ]
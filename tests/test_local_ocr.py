@@ -0,0 +1,29 @@
+import asyncio
+import os
+from concurrent.futures.process import BrokenProcessPool
+from app.core.config.config import Config
+from app.services.local_ocr import get_local_ocr_pool, shutdown_local_ocr_pool
+from app.services.receipt_service import extract_receipt
+
+
+def test_broken_pool_is_replaced(monkeypatch):
+    monkeypatch.setattr(Config, "LOCAL_OCR_WORKERS", 1)
+    pool = get_local_ocr_pool(Config.LOCAL_OCR_WORKERS)
+    try:
+        pool.submit(os._exit, 1).result()
+        assert False, "expected BrokenProcessPool"
+    except BrokenProcessPool:
+        pass
+
+    try:
+        asyncio.run(extract_receipt(b"", "receipt.png", "local"))
+        assert False, "expected RuntimeError"
+    except RuntimeError as e:
+        assert "crashed" in str(e)
+
+    try:
+        new_pool = get_local_ocr_pool(Config.LOCAL_OCR_WORKERS)
+        assert new_pool is not pool
+        assert new_pool.submit(abs, -1).result() == 1
+    finally:
+        shutdown_local_ocr_pool()
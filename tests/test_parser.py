@@ -0,0 +1,28 @@
+import io
+from openpyxl import Workbook
+from app.utils.parser import iter_expense_chunks
+
+HEADER = ["ID", "Date", "Category", "Description", "Amount", "Receipt_Attached", "Receipt_ID"]
+ROWS = [
+    ["E1", "2024-01-01", "Meals", "Lunch", 12.5, "Yes", "R1"],
+    ["E2", "2024-01-02", "Travel", "Taxi", 30, "No", None],
+    ["E3", "2024-01-03", "Travel", "Bus", 3, None, None]
+]
+
+
+def test_xlsx_receipt_flags_match_csv():
+    workbook = Workbook()
+    workbook.active.append(HEADER)
+    for row in ROWS:
+        workbook.active.append(row)
+    xlsx = io.BytesIO()
+    workbook.save(xlsx)
+    xlsx.seek(0)
+
+    csv = "\n".join(",".join("" if value is None else str(value) for value in row) for row in [HEADER] + ROWS)
+
+    xlsx_df = next(iter_expense_chunks(xlsx, "expenses.xlsx", 10))
+    csv_df = next(iter_expense_chunks(io.BytesIO(csv.encode()), "expenses.csv", 10))
+
+    assert xlsx_df["Receipt_Attached"].tolist() == csv_df["Receipt_Attached"].tolist()
+    assert xlsx_df.dtypes.to_dict() == csv_df.dtypes.to_dict()
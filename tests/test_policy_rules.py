@@ -0,0 +1,36 @@
+import math
+import pandas as pd
+from app.core.config.config import Config
+from app.services.policy_rules import extract_policy_rules, evaluate_policy_rules
+
+POLICY_CHUNKS = [
+    "Meals: up to $50 per day.",
+    "Taxi fares are reimbursed up to $40 per ride."
+]
+
+
+def test_missing_categories_are_left_to_the_llm():
+    rules = extract_policy_rules(POLICY_CHUNKS)
+    categories = [None, math.nan, pd.NA, "", "  ", "Meals"]
+    decisions = evaluate_policy_rules(rules, POLICY_CHUNKS, categories, [10.0] * len(categories))
+
+    assert decisions[:5] == [None] * 5
+    assert decisions[5].startswith("Compliant: Amount 10 is within the Meals cap")
+
+
+def test_categories_without_a_cap_are_left_to_the_llm(monkeypatch):
+    policy_chunks = ["Hotel stays are limited to $200 per night. Flights must not exceed $800."]
+    rules = extract_policy_rules(policy_chunks)
+    monkeypatch.setattr(Config, "POLICY_UNCAPPED_CATEGORIES", [])
+    decisions = evaluate_policy_rules(rules, policy_chunks, ["Lodging", "Airfare", "Software"], [5000.0, 4000.0, 30.0])
+
+    assert decisions == [None, None, None]
+
+
+def test_allow_listed_categories_are_settled_as_uncapped(monkeypatch):
+    rules = extract_policy_rules(POLICY_CHUNKS)
+    monkeypatch.setattr(Config, "POLICY_UNCAPPED_CATEGORIES", ["Software", "Meals"])
+    decisions = evaluate_policy_rules(rules, POLICY_CHUNKS, ["Software", "Lodging"], [30.0, 300.0])
+
+    assert decisions[0].startswith("Compliant: The policy sets no limit for Software")
+    assert decisions[1] is None
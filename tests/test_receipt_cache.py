@@ -0,0 +1,25 @@
+import numpy as np
+from azure.ai.formrecognizer import AnalyzedDocument, AnalyzeResult, CurrencyValue, DocumentField
+from app.core.disk_cache import DiskCache
+from app.services.receipt_cache import ReceiptCache
+from app.services.receipt_service import extract_receipt_fields
+
+
+def test_azure_receipt_fields_round_trip_through_the_cache(tmp_path):
+    result = AnalyzeResult(documents=[AnalyzedDocument(
+        doc_type="receipt.retailMeal",
+        fields={
+            "TransactionId": DocumentField(value_type="string", value="R1", confidence=0.99),
+            "Total": DocumentField(value_type="currency", value=CurrencyValue(amount=12.5, symbol="$", code="USD"), confidence=0.98)
+        }
+    )])
+    fields = extract_receipt_fields(result)
+    assert fields["receipt_id"] == "R1"
+    assert fields["amount"] == 12.5
+
+    receipt_cache = ReceiptCache(DiskCache(str(tmp_path / "receipts.sqlite3"), 100, 3600))
+    receipt_cache.set("abc", "azure", fields, np.ones((1, 4), dtype=np.float32))
+    cached = receipt_cache.get("abc", "azure")
+
+    assert cached is not None
+    assert {key: cached[key] for key in fields} == fields
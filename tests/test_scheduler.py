@@ -0,0 +1,97 @@
+import asyncio
+import time
+import httpx
+import openai
+from app.core.config.config import Config
+from app.core.scheduler import RequestScheduler, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW, _retry_after_seconds
+
+
+def _rate_limit_error(headers: dict) -> openai.RateLimitError:
+    response = httpx.Response(429, headers=headers, request=httpx.Request("POST", "https://example.invalid"))
+    return openai.RateLimitError("Rate limit exceeded.", response=response, body=None)
+
+
+def _flaky_call(errors: list, result="ok"):
+    # Raises the given errors one per attempt, then returns `result`
+    attempts = []
+
+    async def call():
+        attempts.append(time.monotonic())
+        if len(attempts) <= len(errors):
+            raise errors[len(attempts) - 1]
+        return result
+    return call, attempts
+
+
+def _run_in_order(scheduler: RequestScheduler, priorities: list) -> list:
+    """
+    Queues one call per priority, in list order, behind an exhausted request
+    budget and returns the order the calls were admitted in.
+    """
+    admitted = []
+
+    async def main():
+        await scheduler.submit(lambda: asyncio.sleep(0))  # Use up the one-request burst
+
+        async def record(i):
+            admitted.append(i)
+
+        await asyncio.gather(*[
+            scheduler.submit(lambda i=i: record(i), priority=priority)
+            for i, priority in enumerate(priorities)
+        ])
+
+    asyncio.run(main())
+    return admitted
+
+
+def test_retry_after_headers():
+    assert _retry_after_seconds({"retry-after-ms": "1500"}) == 1.5
+    assert _retry_after_seconds({"retry-after": "2"}) == 2.0
+    assert _retry_after_seconds({"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"}) == 0.0
+    assert _retry_after_seconds({"retry-after": "soon"}) is None
+    assert _retry_after_seconds({}) is None
+
+
+def test_malformed_retry_after_falls_back_to_backoff():
+    scheduler = RequestScheduler("test", max_retries=2, backoff_base=0.01, backoff_max=0.01)
+    call, attempts = _flaky_call([_rate_limit_error({"retry-after": "soon"})])
+
+    assert asyncio.run(scheduler.submit(call)) == "ok"
+    assert len(attempts) == 2
+    assert scheduler.throttled == 1 and scheduler.retries == 1
+
+
+def test_retry_waits_for_retry_after():
+    scheduler = RequestScheduler("test", max_retries=2, backoff_base=0.01, backoff_max=0.01)
+    call, attempts = _flaky_call([_rate_limit_error({"retry-after-ms": "200"})])
+
+    assert asyncio.run(scheduler.submit(call)) == "ok"
+    assert attempts[1] - attempts[0] >= 0.19
+
+
+def test_non_retryable_errors_are_raised():
+    scheduler = RequestScheduler("test", max_retries=2, backoff_base=0.01, backoff_max=0.01)
+    call, attempts = _flaky_call([ValueError("bad request")])
+
+    try:
+        asyncio.run(scheduler.submit(call))
+        assert False, "expected ValueError"
+    except ValueError:
+        pass
+    assert len(attempts) == 1
+
+
+def test_waiting_calls_are_admitted_by_priority(monkeypatch):
+    # 600 requests per minute with a 0.1s burst: one request at a time, one every 0.1s
+    monkeypatch.setattr(Config, "SCHEDULER_BURST_SECONDS", 0.1)
+    scheduler = RequestScheduler("test", requests_per_minute=600)
+
+    assert _run_in_order(scheduler, [PRIORITY_LOW, PRIORITY_NORMAL, PRIORITY_HIGH]) == [2, 1, 0]
+
+
+def test_calls_of_equal_priority_are_admitted_in_arrival_order(monkeypatch):
+    monkeypatch.setattr(Config, "SCHEDULER_BURST_SECONDS", 0.1)
+    scheduler = RequestScheduler("test", requests_per_minute=600)
+
+    assert _run_in_order(scheduler, [PRIORITY_NORMAL] * 4) == [0, 1, 2, 3]